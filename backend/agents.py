@@ -1,9 +1,36 @@
 import os
+import copy
 import json
 import asyncio
-from typing import AsyncGenerator, List, Dict, Any, Optional
-from groq import AsyncGroq
-from .tools import TOOL_DEFINITIONS, AVAILABLE_TOOLS
+import hashlib
+import time
+from typing import AsyncGenerator, List, Dict, Any, Optional, Tuple
+from groq import AsyncGroq, RateLimitError
+from .cache import ResultCache
+from .clients import get_groq_client
+from .context import prompt_budget, message_tokens, count_tokens
+from .metrics import NodeStats, MODEL_FALLBACKS
+from .routing import FALLBACK_TTFT_MS
+from .ratelimit import (
+    limiter, retry_delay, record_retry, Ticket, PRIORITY_BATCH, RETRYABLE_ERRORS, MAX_RETRIES, QUEUE_NOTICE_SECONDS,
+)
+from .tools import TOOL_DEFINITIONS, TOOL_ERROR_PREFIXES, run_tool
+
+# Opt-in completion cache: identical (model, prompt, messages, tools, sampling) requests
+# replay the recorded stream instead of calling Groq again
+COMPLETION_CACHE_PATH = os.environ.get("AGENTFORGE_COMPLETION_CACHE_PATH") or None
+COMPLETION_CACHE_ENABLED = bool(COMPLETION_CACHE_PATH) or os.environ.get("AGENTFORGE_COMPLETION_CACHE", "").lower() in ("1", "true", "yes")
+
+completion_cache = ResultCache(
+    "completions",
+    max_entries=int(os.environ.get("AGENTFORGE_COMPLETION_CACHE_SIZE", "128")),
+    ttl=float(os.environ.get("AGENTFORGE_COMPLETION_CACHE_TTL", "0")),
+    path=COMPLETION_CACHE_PATH,
+    max_disk_entries=int(os.environ.get("AGENTFORGE_COMPLETION_CACHE_DISK_SIZE", "5000")),
+) if COMPLETION_CACHE_ENABLED else None
+
+# Start each tool call as soon as its arguments have streamed, instead of after the whole completion
+EARLY_TOOL_DISPATCH = os.environ.get("AGENTFORGE_EARLY_TOOL_DISPATCH", "1").lower() in ("1", "true", "yes")
 
 # Predefined System Prompts
 AGENT_PROMPTS = {
@@ -32,12 +59,50 @@ AGENT_PROMPTS = {
     )
 }
 
+async def _replay(chunks: List[str]) -> AsyncGenerator[str, None]:
+    for chunk in chunks:
+        yield chunk
+
+def _json_complete(text: str) -> bool:
+    """
+    True once streamed tool arguments form a whole JSON object.
+    """
+    try:
+        return isinstance(json.loads(text), dict)
+    except ValueError:
+        return False
+
+def _call_signature(function: Dict[str, str]) -> Tuple[str, Any]:
+    """
+    Tool name and parsed arguments, so formatting-only differences compare equal.
+    """
+    try:
+        arguments = json.loads(function["arguments"]) if function["arguments"] else {}
+    except ValueError:
+        arguments = function["arguments"]
+    return function["name"], arguments
+
+async def _chain(head: List[Any], iterator) -> AsyncGenerator[Any, None]:
+    for chunk in head:
+        yield chunk
+    async for chunk in iterator:
+        yield chunk
+
 class Agent:
-    def __init__(self, name: str, system_prompt: str = "", model: str = "llama3-70b-8192", tools: List[str] = None):
+    def __init__(self, name: str, system_prompt: str = "", model: str = "llama3-70b-8192", tools: List[str] = None, client: Optional[AsyncGroq] = None, use_cache: bool = True, priority: int = PRIORITY_BATCH, fallback_model: Optional[str] = None, temperature: float = 0.7, max_tokens: int = 2048):
         self.name = name
         self.system_prompt = system_prompt or AGENT_PROMPTS.get(name, "You are a helpful AI assistant.")
         self.model = model
-        self.client = AsyncGroq(api_key=os.environ.get("GROQ_API_KEY"))
+        # Used when `model` is rate limited or slow to start (see routing.py)
+        self.fallback_model = fallback_model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        # Per-request bypass of the completion cache (only used when the cache is enabled)
+        self.use_cache = use_cache and completion_cache is not None
+        # Shared, pooled client: reuses kept-alive connections across nodes and runs
+        self.client = client or get_groq_client()
+        # Rate limiter queue priority (PRIORITY_INTERACTIVE for /run_node)
+        self.priority = priority
         
         # Filter available tools based on config
         # For this demo, Researcher and Coder get all tools by default
@@ -46,6 +111,244 @@ class Agent:
         else:
             self.tools = None # Writer/Critic usually don't need tools in this flow
 
+        # Performance counters for the current run_stream (TTFT, tokens, tool latency...)
+        self.stats = NodeStats(self.name, self.model)
+
+    def context_budget(self) -> int:
+        """
+        Tokens this agent can spend on conversation history (see ContextWindow.build).
+        """
+        return prompt_budget(self.model, self.max_tokens, self.system_prompt, self.tools)
+
+    def _estimate_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Upper bound on the tokens one call can use, charged against the TPM budget.
+        """
+        tokens = sum(message_tokens(m) for m in messages) + self.max_tokens
+        if self.tools:
+            tokens += count_tokens(json.dumps(self.tools))
+        return tokens
+
+    async def _execute_tool(self, fn_name: str, args_str: str) -> str:
+        started = time.perf_counter()
+        try:
+            args = json.loads(args_str) if args_str else {}
+        except Exception as e:
+            result = f"Error executing tool: {str(e)}"
+        else:
+            result = await run_tool(fn_name, args)
+        self.stats.observe_tool(time.perf_counter() - started, result.startswith(TOOL_ERROR_PREFIXES))
+        return result
+
+    def _cache_key(self, messages: List[Dict[str, Any]]) -> str:
+        payload = json.dumps({
+            "model": self.model,
+            "messages": messages,  # includes the system prompt
+            "tools": self.tools,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def _acquire(self, messages: List[Dict[str, Any]]) -> Ticket:
+        """
+        Queues for rate limiter capacity for one more request (a retry or a
+        fallback hedge), behind the calls already waiting.
+        """
+        ticket = limiter.submit(self._estimate_tokens(messages), self.priority)
+        try:
+            await asyncio.wait({ticket.granted})
+        finally:
+            if not ticket.granted.done():
+                limiter.cancel(ticket)
+        return ticket
+
+    async def _open_stream(self, model: str, messages: List[Dict[str, Any]], ticket: Ticket):
+        """
+        Starts a streamed completion on `model` and reads up to its first token or
+        tool call. Returns (stream, iterator, chunks read so far, first token time).
+        If the request is rejected, its rate limiter `ticket` is refunded.
+        """
+        try:
+            stream = await self.client.chat.completions.create(
+                messages=messages,
+                model=model,
+                tools=self.tools if self.tools else None,
+                tool_choice="auto" if self.tools else None,
+                stream=True,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens
+            )
+        except RETRYABLE_ERRORS:
+            limiter.settle(ticket, 0)
+            raise
+        iterator = stream.__aiter__()
+        head = []
+        async for chunk in iterator:
+            head.append(chunk)
+            if chunk.choices and (chunk.choices[0].delta.content or chunk.choices[0].delta.tool_calls):
+                return stream, iterator, head, time.perf_counter()
+        return stream, iterator, head, None
+
+    async def _race_stream(self, model: str, messages: List[Dict[str, Any]], ticket: Optional[Ticket] = None):
+        """
+        One side of a fallback race: _open_stream under its own ticket, acquired
+        first if none is given. Returns (ticket, _open_stream result).
+        """
+        if ticket is None:
+            ticket = await self._acquire(messages)
+        try:
+            return ticket, await self._open_stream(model, messages, ticket)
+        except asyncio.CancelledError:
+            # Lost the race before its first token: refund the completion it never generated
+            limiter.settle(ticket, ticket.tokens - self.max_tokens)
+            raise
+
+    async def _open_completion(self, model: str, messages: List[Dict[str, Any]], ticket: Ticket):
+        """
+        Opens a completion on `model`. If its first token takes longer than
+        FALLBACK_TTFT_MS, the fallback model is asked as well (with its own rate
+        limiter ticket) and whichever answers first is used; the other request is
+        cancelled. Returns (model, ticket, _open_stream result) of the one used.
+        """
+        fallback = self.fallback_model if self.fallback_model != model else None
+        if not fallback or FALLBACK_TTFT_MS <= 0:
+            return model, ticket, await self._open_stream(model, messages, ticket)
+
+        primary = asyncio.create_task(self._race_stream(model, messages, ticket))
+
+        racers = {primary: model}
+        winner = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=FALLBACK_TTFT_MS / 1000)
+            if not done:
+                MODEL_FALLBACKS.inc(model=model, fallback=fallback, reason="slow_ttft")
+                racers[asyncio.create_task(self._race_stream(fallback, messages))] = fallback
+            pending = set(racers)
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer the primary if both finished together
+                for task in sorted(done, key=lambda t: t is not primary):
+                    if not task.exception():
+                        winner = task
+                        break
+            if winner is None:
+                return (model, *primary.result())  # raises the primary's error
+            return (racers[winner], *winner.result())
+        finally:
+            for task in racers:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and not task.exception():
+                    loser, opened = task.result()
+                    await opened[0].close()
+                    limiter.settle(loser, loser.tokens - self.max_tokens)
+
+    def _dispatch_tool(self, tool_calls: List[Dict[str, Any]], index: int, tool_tasks: Dict[int, asyncio.Task], dispatched: Dict[int, Tuple[str, Any]]):
+        """
+        Starts tool call `index` in the background once its arguments are final,
+        recording what it was started with in `dispatched`.
+        """
+        if index in tool_tasks or index >= len(tool_calls):
+            return
+        function = tool_calls[index]["function"]
+        dispatched[index] = _call_signature(function)
+        tool_tasks[index] = asyncio.create_task(self._execute_tool(function["name"], function["arguments"]))
+
+    async def _stream_completion(self, messages: List[Dict[str, Any]], tool_calls: List[Dict[str, Any]], progress: Dict[str, Any], ticket: Ticket, tool_tasks: Optional[Dict[int, asyncio.Task]] = None) -> AsyncGenerator[str, None]:
+        """
+        Streams one Groq completion, yielding text chunks.
+        `ticket` is the rate limiter grant for the first attempt; every retry queues
+        for its own, and the one that streamed is settled once the stream ends.
+        Tool call fragments are accumulated into `tool_calls`; `progress` records
+        when the first token/tool call arrived and how many tokens were streamed.
+        With `tool_tasks`, each tool call is started (index -> task) as soon as its
+        arguments are complete, while the rest of the response is still streaming.
+        """
+        model = self.model
+        attempt = 0
+        while True:
+            try:
+                if ticket is None:
+                    ticket = await self._acquire(messages)
+                model, ticket, (stream, iterator, head, first_token) = await self._open_completion(model, messages, ticket)
+                break
+            except RETRYABLE_ERRORS as e:
+                # The rejected request's ticket was refunded; the next attempt queues again
+                ticket = None
+                if isinstance(e, RateLimitError) and self.fallback_model and model != self.fallback_model:
+                    # Primary model is rate limited: switch to the fallback right away
+                    MODEL_FALLBACKS.inc(model=model, fallback=self.fallback_model, reason="rate_limited")
+                    model = self.fallback_model
+                    continue
+                # Back off and retry instead of failing the node
+                if attempt >= MAX_RETRIES:
+                    raise
+                delay = retry_delay(e, attempt)
+                record_retry(model, e)
+                attempt += 1
+                if isinstance(e, RateLimitError):
+                    # Hold the whole queue, this retry included, until the window has passed
+                    limiter.throttle(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+        progress["model"] = model
+        progress["first_token"] = first_token
+        # Name and parsed arguments each early-started tool call was started with
+        dispatched: Dict[int, Tuple[str, Any]] = {}
+
+        try:
+            async for chunk in _chain(head, iterator):
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                # Capture content (one streamed chunk is roughly one token)
+                content = delta.content
+                if content:
+                    progress["tokens"] = progress.get("tokens", 0) + 1
+                    yield content
+            
+                # Capture tool calls (accumulate chunks)
+                if chunk.choices[0].delta.tool_calls:
+                    for tc in chunk.choices[0].delta.tool_calls:
+                        if len(tool_calls) <= tc.index:
+                            # A new call begins, so the previous call's arguments are final
+                            if tool_tasks is not None and tc.index > 0:
+                                self._dispatch_tool(tool_calls, tc.index - 1, tool_tasks, dispatched)
+                            tool_calls.append({
+                                "id": tc.id,
+                                "type": tc.type,
+                                "function": {"name": "", "arguments": ""}
+                            })
+                    
+                        # Append name (often only in first chunk)
+                        if tc.function.name:
+                            tool_calls[tc.index]["function"]["name"] += tc.function.name
+                        # Append arguments
+                        if tc.function.arguments:
+                            tool_calls[tc.index]["function"]["arguments"] += tc.function.arguments
+
+                        if tool_tasks is not None:
+                            if tc.index in tool_tasks:
+                                # A closed arguments object is final; only a fragment that changes the
+                                # call (not trailing whitespace) means it must run again at the end.
+                                # Sync tools can't be stopped mid-run, so restarts are kept to real changes
+                                changed = tc.function.name or (tc.function.arguments or "").strip()
+                                if changed and _call_signature(tool_calls[tc.index]["function"]) != dispatched[tc.index]:
+                                    tool_tasks.pop(tc.index).cancel()
+                            elif tc.function.arguments and "}" in tc.function.arguments and _json_complete(tool_calls[tc.index]["function"]["arguments"]):
+                                # The arguments object just closed
+                                self._dispatch_tool(tool_calls, tc.index, tool_tasks, dispatched)
+        finally:
+            # Also runs when the consumer stops early (client disconnect, cancelled run):
+            # release the Groq connection instead of reading the rest of the generation
+            await stream.close()
+            # Refund the unused part of the max_tokens estimate
+            limiter.settle(ticket, ticket.tokens - self.max_tokens + progress["tokens"])
+
     async def run_stream(self, messages: List[Dict[str, str]]) -> AsyncGenerator[Dict[str, str], None]:
         """
         Stream response from Groq. Handles tool calls internally.
@@ -54,47 +357,61 @@ class Agent:
         
         while True:
             try:
-                # 1. Call LLM
-                response_stream = await self.client.chat.completions.create(
-                    messages=current_messages,
-                    model=self.model,
-                    tools=self.tools if self.tools else None,
-                    tool_choice="auto" if self.tools else None,
-                    stream=True,
-                    temperature=0.7,
-                    max_tokens=2048
-                )
-
+                # 1. Call LLM (or replay a cached completion)
                 tool_calls = []
+                # Tool calls already started while the completion was streaming
+                tool_tasks: Dict[int, asyncio.Task] = {}
                 current_text_content = ""
-                
-                async for chunk in response_stream:
-                    # Capture content
-                    content = chunk.choices[0].delta.content
-                    if content:
+                cache_key = self._cache_key(current_messages) if self.use_cache else None
+                cached = await asyncio.to_thread(completion_cache.get, cache_key) if cache_key else None
+
+                progress: Dict[str, Any] = {"requested": time.perf_counter(), "first_token": None, "tokens": 0}
+                if cached is not None:
+                    tool_calls = copy.deepcopy(cached["tool_calls"])
+                    source = _replay(cached["chunks"])
+                    progress["first_token"] = progress["requested"]
+                    progress["tokens"] = len(cached["chunks"])
+                else:
+                    # Wait for rate limit capacity, telling the client where it is in the queue
+                    ticket = limiter.submit(self._estimate_tokens(current_messages), self.priority)
+                    try:
+                        while not ticket.granted.done():
+                            done, _ = await asyncio.wait({ticket.granted}, timeout=QUEUE_NOTICE_SECONDS)
+                            if not done:
+                                yield {
+                                    "type": "queued",
+                                    "text": f"Waiting for Groq capacity (queue position {limiter.position(ticket)})...",
+                                    "agent": self.name
+                                }
+                    finally:
+                        if not ticket.granted.done():
+                            limiter.cancel(ticket)
+                    now = time.perf_counter()
+                    self.stats.queue_wait += now - progress["requested"]
+                    progress["requested"] = now
+                    source = self._stream_completion(current_messages, tool_calls, progress, ticket, tool_tasks if EARLY_TOOL_DISPATCH else None)
+
+                chunks = []
+                try:
+                    async for content in source:
+                        chunks.append(content)
                         current_text_content += content
                         yield {
                             "type": "thought",
                             "text": content,
                             "agent": self.name
                         }
-                    
-                    # Capture tool calls (accumulate chunks)
-                    if chunk.choices[0].delta.tool_calls:
-                        for tc in chunk.choices[0].delta.tool_calls:
-                            if len(tool_calls) <= tc.index:
-                                tool_calls.append({
-                                    "id": tc.id,
-                                    "type": tc.type,
-                                    "function": {"name": "", "arguments": ""}
-                                })
-                            
-                            # Append name (often only in first chunk)
-                            if tc.function.name:
-                                tool_calls[tc.index]["function"]["name"] += tc.function.name
-                            # Append arguments
-                            if tc.function.arguments:
-                                tool_calls[tc.index]["function"]["arguments"] += tc.function.arguments
+                finally:
+                    await source.aclose()
+
+                self.stats.observe_completion(
+                    progress["requested"], progress["first_token"], progress["tokens"],
+                    status="cached" if cached is not None else "ok", model=progress.get("model"),
+                )
+                # Only completions that streamed to the end are recorded, and only from the
+                # requested model: the key doesn't cover a fallback that answered instead
+                if cache_key and cached is None and progress.get("model") == self.model:
+                    await asyncio.to_thread(completion_cache.set, cache_key, {"chunks": chunks, "tool_calls": tool_calls})
 
                 # If we have textual content, add it to history
                 if current_text_content:
@@ -102,23 +419,8 @@ class Agent:
 
                 # 2. Process Tool Calls
                 if tool_calls:
-                    # Add tool calls to history
-                    current_messages.append({
-                        "role": "assistant",
-                        "tool_calls": tool_calls, 
-                        # content must be null if tool_calls is present? 
-                        # Actually Groq/OpenAI allows content + tool_calls. 
-                        # We already appended content above if it existed, but `tool_calls` message 
-                        # might need to be separate or combined. 
-                        # Standard Practice: One message with both if both present, or separate.
-                        # Let's replace the last message if we just added content, or append new one?
-                        # Simplification: Append a new message strictly for tool calls if needed, 
-                        # but standard API expects the `tool_calls` field on the *assistant* message.
-                        # So if we had content, we should merge.
-                        # Let's rebuild the last message properly.
-                    })
-                    
-                    # Fix history: Pop the content-only message if we added it, replace with combined
+                    # The assistant message must carry both the text (if any) and the tool calls,
+                    # so replace the content-only message appended above with a combined one
                     if current_text_content:
                         current_messages.pop()
                     
@@ -128,8 +430,9 @@ class Agent:
                         "tool_calls": tool_calls
                     })
 
-                    # Execute loop
-                    for tc in tool_calls:
+                    # Announce every call, then run them all concurrently
+                    pending = []
+                    for index, tc in enumerate(tool_calls):
                         fn_name = tc["function"]["name"]
                         args_str = tc["function"]["arguments"]
                         
@@ -138,32 +441,18 @@ class Agent:
                             "text": f"\n[Executing tool: {fn_name}({args_str})]\n",
                             "agent": self.name
                         }
-                        
-                        try:
-                            args = json.loads(args_str)
-                            tool_fn = AVAILABLE_TOOLS.get(fn_name)
-                            
-                            if tool_fn:
-                                result = tool_fn(**args)
-                            else:
-                                result = f"Error: Tool {fn_name} not found."
-                                
-                        except Exception as e:
-                            result = f"Error executing tool: {str(e)}"
-                        
-                        # Yield result status (optional, maybe too verbose to show full JSON)
-                        # yield {
-                        #     "type": "info", 
-                        #     "text": f"\n[Tool Result: {str(result)[:50]}...]\n", 
-                        #     "agent": self.name
-                        # }
-
-                        # Append tool output to history
+                        # Reuse the task if the call was already started mid-stream
+                        pending.append(tool_tasks.pop(index, None) or self._execute_tool(fn_name, args_str))
+
+                    results = await asyncio.gather(*pending)
+
+                    # Append tool outputs to history, in the order the model issued the calls
+                    for tc, result in zip(tool_calls, results):
                         current_messages.append({
                             "role": "tool",
                             "tool_call_id": tc["id"],
-                            "name": fn_name,
-                            "content": str(result)
+                            "name": tc["function"]["name"],
+                            "content": result
                         })
 
                     # Loop continues to next iteration to let LLM process tool results
@@ -174,9 +463,14 @@ class Agent:
                     break
 
             except Exception as e:
+                self.stats.errors += 1
                 yield {
                     "type": "error",
                     "text": f"Error in agent loop: {str(e)}",
                     "agent": self.name
                 }
                 break
+            finally:
+                # Tools started mid-stream whose results will never be used
+                for task in tool_tasks.values():
+                    task.cancel()
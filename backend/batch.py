@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import codecs
+import asyncio
+import statistics
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional
+from .scheduler import WorkflowGraph, execute_graph
+from .metrics import RUNS, RUNS_IN_PROGRESS, RUN_DURATION, RUNS_CANCELLED
+from .ratelimit import PRIORITY_BULK
+
+# Items of one batch executing at once (each item is a full workflow run)
+BATCH_CONCURRENCY = int(os.environ.get("AGENTFORGE_BATCH_CONCURRENCY", "8"))
+
+
+async def run_item(graph: WorkflowGraph, index: int, prompt: str, item_id: Any = None,
+                   max_concurrency: Optional[int] = None, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Runs the compiled graph for one prompt and collects every node's output.
+    Its LLM calls queue behind interactive and streamed /run work (PRIORITY_BULK).
+    """
+    started = time.perf_counter()
+    outputs: Dict[str, str] = {}
+    errors: List[str] = []
+    try:
+        async for event in execute_graph(graph, prompt, max_concurrency=max_concurrency, use_cache=use_cache, priority=PRIORITY_BULK):
+            if event["type"] == "thought":
+                outputs[event["node_id"]] = outputs.get(event["node_id"], "") + event["text"]
+            elif event["type"] == "error":
+                errors.append(event["text"])
+    except Exception as e:
+        errors.append(f"Error details: {str(e)}")
+
+    # The answer is the output of the last node (in topological order) that produced one
+    final = next((outputs[node_id] for node_id in reversed(graph.order) if outputs.get(node_id)), "")
+    result = {
+        "index": index,
+        "status": "error" if errors else "success",
+        "output": final,
+        "outputs": outputs,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    if item_id is not None:
+        result["id"] = item_id
+    if errors:
+        result["errors"] = errors
+    return result
+
+
+class BatchRunner:
+    """
+    Runs one compiled workflow over many prompts with bounded concurrency.
+    Prompts are queued with put() (which waits while the queue is full) and
+    results() yields each item's result as it finishes, then a summary.
+    """
+
+    def __init__(self, graph: WorkflowGraph, concurrency: int = BATCH_CONCURRENCY,
+                 max_concurrency: Optional[int] = None, use_cache: bool = True):
+        self.graph = graph
+        self.concurrency = max(1, concurrency)
+        self.max_concurrency = max_concurrency
+        self.use_cache = use_cache
+        self._inbox: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        self._results: asyncio.Queue = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._count = 0
+        self._closed = False
+        self.started = time.perf_counter()
+
+    def start(self):
+        RUNS.inc(endpoint="run_batch")
+        RUNS_IN_PROGRESS.inc(endpoint="run_batch")
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def put(self, prompt: Any, item_id: Any = None):
+        """
+        Queues one item. A non-string prompt is reported as a failed item.
+        """
+        index = self._count
+        self._count += 1
+        if not isinstance(prompt, str) or not prompt.strip():
+            result = {"index": index, "status": "error", "errors": [f"Invalid item: {prompt!r}"], "duration_ms": 0.0}
+            if item_id is not None:
+                result["id"] = item_id
+            await self._results.put(result)
+            return
+        await self._inbox.put((index, prompt, item_id))
+
+    async def close_input(self):
+        if not self._closed:
+            self._closed = True
+            for _ in self._workers:
+                await self._inbox.put(None)
+
+    async def feed(self, items: AsyncIterator[Any]):
+        try:
+            async for item in items:
+                await self.put(*item)
+        finally:
+            await self.close_input()
+
+    async def _work(self):
+        try:
+            while True:
+                item = await self._inbox.get()
+                if item is None:
+                    break
+                index, prompt, item_id = item
+                await self._results.put(await run_item(
+                    self.graph, index, prompt, item_id,
+                    max_concurrency=self.max_concurrency, use_cache=self.use_cache,
+                ))
+        finally:
+            await self._results.put(None)
+
+    async def results(self) -> AsyncGenerator[Dict[str, Any], None]:
+        running = len(self._workers)
+        latencies: List[float] = []
+        succeeded = failed = 0
+        finished = False
+        try:
+            while running:
+                result = await self._results.get()
+                if result is None:
+                    running -= 1
+                    continue
+                if result["status"] == "success":
+                    succeeded += 1
+                    latencies.append(result["duration_ms"])
+                else:
+                    failed += 1
+                yield result
+            # Invalid items that arrived after the last worker stopped
+            while not self._results.empty():
+                result = self._results.get_nowait()
+                if result is not None:
+                    failed += 1
+                    yield result
+            finished = True
+        finally:
+            for task in self._workers:
+                if not task.done():
+                    task.cancel()
+            if not finished:
+                RUNS_CANCELLED.inc(endpoint="run_batch", reason="disconnect")
+            elapsed = time.perf_counter() - self.started
+            RUN_DURATION.observe(elapsed, endpoint="run_batch")
+            RUNS_IN_PROGRESS.dec(endpoint="run_batch")
+
+        ordered = sorted(latencies)
+        yield {"summary": {
+            "total": succeeded + failed,
+            "succeeded": succeeded,
+            "failed": failed,
+            "duration_ms": round(elapsed * 1000, 1),
+            "items_per_sec": round((succeeded + failed) / elapsed, 3) if elapsed else 0.0,
+            "latency_ms": {
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1],
+                "mean": round(statistics.fmean(ordered), 1),
+            } if ordered else {},
+        }}
+
+    async def abort(self):
+        """
+        Stops the workers (e.g. the client went away before results were streamed).
+        """
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        RUNS_CANCELLED.inc(endpoint="run_batch", reason="disconnect")
+        RUNS_IN_PROGRESS.dec(endpoint="run_batch")
+
+
+async def read_jsonl(chunks: AsyncIterator[bytes]) -> AsyncGenerator[Any, None]:
+    """
+    Parses a JSON Lines byte stream as it arrives. Blank lines are skipped;
+    a line that isn't valid JSON yields the ValueError instead of stopping the stream.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    async for data in chunks:
+        buffer += decoder.decode(data)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield e
+    buffer += decoder.decode(b"", final=True)
+    if buffer.strip():
+        try:
+            yield json.loads(buffer)
+        except ValueError as e:
+            yield e
+
+
+async def encode_jsonl(items: AsyncIterator[Dict[str, Any]]) -> AsyncGenerator[bytes, None]:
+    async for item in items:
+        yield json.dumps(item).encode("utf-8") + b"\n"
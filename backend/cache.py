@@ -0,0 +1,216 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Every cache registers itself here so its counters can be exposed by the API
+CACHES: Dict[str, "ResultCache"] = {}
+
+
+class SQLiteStore:
+    """
+    On-disk cache tier. Values are stored as JSON; the least recently used rows
+    are evicted once the table grows past max_entries.
+    """
+
+    def __init__(self, path: str, table: str, max_entries: int = 10000):
+        self.path = path
+        self.table = "cache_" + "".join(c if c.isalnum() else "_" for c in table)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value), expires_at
+
+    def set(self, key: str, value: Any, expires_at: Optional[float]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, time.time()),
+            )
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResultCache:
+    """
+    Two-tier cache: a size-bounded in-memory LRU in front of an optional SQLite store.
+    Entries expire after `ttl` seconds (0 disables expiry). Thread-safe, so it can be
+    used from tools running on the tool thread pool.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 256,
+        ttl: float = 3600,
+        path: Optional[str] = None,
+        max_disk_entries: int = 10000,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk = SQLiteStore(path, name, max_disk_entries) if path else None
+
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+        # Time spent computing misses, used to estimate the latency saved by hits
+        self._compute_seconds = 0.0
+        self._computed = 0
+        CACHES[name] = self
+
+    def _remember(self, key: str, value: Any, expires_at: Optional[float]):
+        # Caller holds self._lock
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _lookup(self, key: str) -> Tuple[bool, Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return True, value
+                del self._entries[key]
+
+        if self.disk:
+            stored = self.disk.get(key)
+            if stored is not None:
+                value, expires_at = stored
+                with self._lock:
+                    self._remember(key, value, expires_at)
+                    self._counters["disk_hits"] += 1
+                return True, value
+        return False, None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        found, value = self._lookup(key)
+        if not found:
+            with self._lock:
+                self._counters["misses"] += 1
+            return default
+        return value
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._remember(key, value, expires_at)
+        if self.disk:
+            self.disk.set(key, value, expires_at)
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Returns the cached value for key, or computes and stores it.
+        Concurrent callers asking for the same missing key wait for a single computation.
+        Results rejected by `cacheable` (e.g. errors) are returned but not stored.
+        """
+        found, value = self._lookup(key)
+        if found:
+            return value
+
+        with self._lock:
+            pending = self._inflight.get(key)
+            if pending is None:
+                leader = True
+                pending = self._inflight[key] = Future()
+                self._counters["misses"] += 1
+            else:
+                leader = False
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            return pending.result()
+
+        started = time.perf_counter()
+        try:
+            value = compute()
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        else:
+            with self._lock:
+                self._compute_seconds += time.perf_counter() - started
+                self._computed += 1
+            if cacheable is None or cacheable(value):
+                self.set(key, value)
+            pending.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.disk:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+            avg_compute = self._compute_seconds / self._computed if self._computed else 0.0
+        lookups = counters["hits"] + counters["disk_hits"] + counters["misses"] + counters["coalesced"]
+        served = counters["hits"] + counters["disk_hits"] + counters["coalesced"]
+        return {
+            **counters,
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "persistent": self.disk is not None,
+            "hit_rate": round(served / lookups, 4) if lookups else 0.0,
+            "avg_miss_seconds": round(avg_compute, 4),
+            "est_seconds_saved": round(avg_compute * served, 3),
+        }
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in CACHES.items()}
@@ -0,0 +1,47 @@
+import os
+import asyncio
+from typing import Dict, Optional, Tuple
+import httpx
+from groq import AsyncGroq
+
+# Connection pool settings shared by every Groq client in the process
+POOL_SIZE = int(os.environ.get("AGENTFORGE_GROQ_POOL_SIZE", "100"))
+KEEPALIVE_EXPIRY = float(os.environ.get("AGENTFORGE_GROQ_KEEPALIVE", "30"))
+REQUEST_TIMEOUT = float(os.environ.get("AGENTFORGE_GROQ_TIMEOUT", "60"))
+
+# (api_key, base_url) -> client
+_clients: Dict[Tuple[Optional[str], Optional[str]], AsyncGroq] = {}
+
+
+def get_groq_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> AsyncGroq:
+    """
+    Returns the process-wide AsyncGroq client for this API key / base URL,
+    creating it (with a kept-alive connection pool) on first use.
+    """
+    api_key = api_key or os.environ.get("GROQ_API_KEY")
+    base_url = base_url or os.environ.get("GROQ_BASE_URL") or None
+    key = (api_key, base_url)
+
+    client = _clients.get(key)
+    if client is None:
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=POOL_SIZE,
+                max_keepalive_connections=POOL_SIZE,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=10.0),
+        )
+        # Retries are done by the agent loop so they go through the rate limiter (see ratelimit.py)
+        client = AsyncGroq(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+        _clients[key] = client
+    return client
+
+
+async def close_clients():
+    """
+    Closes every pooled client. Called from the FastAPI lifespan on shutdown.
+    """
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
@@ -0,0 +1,138 @@
+import os
+import json
+from typing import Any, Dict, List, Optional
+
+# Optional exact tokenizer; falls back to a ~4 chars/token estimate
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+# Context window (tokens) per Groq model
+MODEL_CONTEXT_WINDOWS = {
+    "llama3-70b-8192": 8192,
+    "llama3-8b-8192": 8192,
+    "llama-3.1-8b-instant": 131072,
+    "llama-3.3-70b-versatile": 131072,
+    "mixtral-8x7b-32768": 32768,
+    "gemma2-9b-it": 8192,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Hard cap on prompt size, even for long-context models: smaller prompts are faster and cheaper
+MAX_PROMPT_TOKENS = int(os.environ.get("AGENTFORGE_MAX_PROMPT_TOKENS", "6000"))
+# Replace dropped turns with a short extractive summary instead of discarding them
+SUMMARIZE_DROPPED = os.environ.get("AGENTFORGE_CONTEXT_SUMMARY", "").lower() in ("1", "true", "yes")
+SUMMARY_TOKENS = 300
+
+# Per-message framing overhead (role, separators) in chat formats
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    return MESSAGE_OVERHEAD + count_tokens(message.get("content"))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens]) + " …[truncated]"
+    return text[:max_tokens * 4] + " …[truncated]"
+
+
+def prompt_budget(model: str, max_tokens: int, system_prompt: str = "", tools: Optional[List[Dict[str, Any]]] = None) -> int:
+    """
+    Tokens available for conversation messages: the model's window minus the
+    completion reserve, system prompt and tool schemas, capped at MAX_PROMPT_TOKENS.
+    """
+    window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    budget = min(window - max_tokens, MAX_PROMPT_TOKENS)
+    budget -= MESSAGE_OVERHEAD + count_tokens(system_prompt)
+    if tools:
+        budget -= count_tokens(json.dumps(tools))
+    return max(budget, 0)
+
+
+class ContextWindow:
+    """
+    Conversation history with token counts computed once per message.
+    build() selects what fits a budget: the original user request is always kept,
+    then the most recent messages, newest first, until the budget runs out.
+    """
+
+    def __init__(self, messages: Optional[List[Dict[str, Any]]] = None, summarize: bool = SUMMARIZE_DROPPED):
+        self.messages: List[Dict[str, Any]] = []
+        self.tokens: List[int] = []
+        self.summarize = summarize
+        # Number of dropped leading messages -> summary; history is append-only so it stays valid
+        self._summaries: Dict[int, Dict[str, str]] = {}
+        for message in messages or []:
+            self.append(message)
+
+    def append(self, message: Dict[str, Any], tokens: Optional[int] = None):
+        self.messages.append(message)
+        self.tokens.append(message_tokens(message) if tokens is None else tokens)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens)
+
+    def _summary(self, start: int, end: int) -> Dict[str, str]:
+        summary = self._summaries.get(end)
+        if summary is None:
+            dropped = self.messages[start:end]
+            per_message = max(SUMMARY_TOKENS // len(dropped), 16)
+            lines = [
+                "- " + truncate_to_tokens(" ".join((m.get("content") or "").split()), per_message)
+                for m in dropped if m.get("content")
+            ]
+            text = truncate_to_tokens("Summary of earlier steps:\n" + "\n".join(lines), SUMMARY_TOKENS)
+            summary = self._summaries[end] = {"role": "assistant", "content": text}
+        return summary
+
+    def build(self, budget: int) -> List[Dict[str, Any]]:
+        if not self.messages:
+            return []
+        if self.total_tokens <= budget:
+            return list(self.messages)
+
+        # Always keep the original request (first user message)
+        head: List[Dict[str, Any]] = []
+        first = 0
+        if self.messages[0].get("role") == "user":
+            head = [self.messages[0]]
+            first = 1
+            budget -= self.tokens[0]
+
+        reserve = SUMMARY_TOKENS + MESSAGE_OVERHEAD if self.summarize else 0
+        remaining = budget - reserve
+
+        # Newest messages first, until one no longer fits
+        start = len(self.messages)
+        while start > first and self.tokens[start - 1] <= remaining:
+            remaining -= self.tokens[start - 1]
+            start -= 1
+
+        tail = self.messages[start:]
+        if not tail and start > first:
+            # The latest message alone is too large: keep as much of it as fits
+            latest = self.messages[-1]
+            tail = [{**latest, "content": truncate_to_tokens(latest.get("content") or "", max(remaining - MESSAGE_OVERHEAD, 0))}]
+            start = len(self.messages) - 1
+
+        if self.summarize and start > first:
+            return head + [self._summary(first, start)] + tail
+        return head + tail
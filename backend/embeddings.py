@@ -0,0 +1,191 @@
+import os
+import time
+import queue
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, List, Optional, Tuple
+from .cache import ResultCache
+from .metrics import EMBED_BATCH, EMBED_SECONDS
+
+# Embedding service
+# local_rag queries and ingestion batches from every thread are gathered into small
+# time-windowed batches and embedded in a process pool, so embedding throughput scales
+# with cores instead of serializing on the GIL. Same model as Chroma's default
+# (ONNX MiniLM), so vectors match collections that Chroma embedded itself.
+def _default_workers() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Worker processes (0 = embed in-process, on the batching thread); defaults to the available cores
+EMBED_WORKERS = int(os.environ.get("AGENTFORGE_EMBED_WORKERS", str(_default_workers())))
+EMBED_BATCH_SIZE = int(os.environ.get("AGENTFORGE_EMBED_BATCH_SIZE", "32"))
+# How long the first text of a batch waits for others to join it
+EMBED_BATCH_MS = float(os.environ.get("AGENTFORGE_EMBED_BATCH_MS", "5"))
+
+# Recently seen query embeddings (ingested documents are not cached)
+query_embedding_cache = ResultCache(
+    "query_embeddings",
+    max_entries=int(os.environ.get("AGENTFORGE_EMBED_CACHE_SIZE", "1024")),
+    ttl=0,
+)
+
+# Loaded once per worker process (or once in-process)
+_embedding_function = None
+
+
+def _load_embedding_function():
+    global _embedding_function
+    if _embedding_function is None:
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+        _embedding_function = DefaultEmbeddingFunction()
+    return _embedding_function
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    # Plain lists: picklable across processes and accepted by Chroma
+    return [[float(x) for x in vector] for vector in _load_embedding_function()(texts)]
+
+
+class EmbeddingService:
+    """
+    Micro-batching front end to the embedding model. embed() can be called from
+    any thread; requests arriving within `window_ms` of each other are merged
+    (duplicates embedded once) into batches of up to `batch_size` texts, and
+    batches run in parallel across the worker processes.
+    """
+
+    def __init__(self, workers: int = EMBED_WORKERS, batch_size: int = EMBED_BATCH_SIZE, window_ms: float = EMBED_BATCH_MS,
+                 embed_batch: Callable[[List[str]], List[List[float]]] = _embed_batch):
+        self.workers = max(0, workers)
+        self.batch_size = max(1, batch_size)
+        self.window = window_ms / 1000
+        self.embed_batch = embed_batch
+        self._queue: "queue.Queue[Optional[Tuple[List[str], Future]]]" = queue.Queue()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    if self.workers:
+                        # spawn: ONNX Runtime isn't fork-safe, and the server process has threads
+                        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                    thread = threading.Thread(target=self._dispatch, name="embedding-batcher", daemon=True)
+                    thread.start()
+                    self._thread = thread
+
+    def embed(self, texts: List[str], kind: str = "document") -> List[List[float]]:
+        """
+        Embeds texts, blocking the calling thread until every batch they joined is done.
+        """
+        if not texts:
+            return []
+        self._ensure_started()
+        started = time.perf_counter()
+        futures = []
+        # Split large requests so their batches spread over the workers
+        for i in range(0, len(texts), self.batch_size):
+            future: Future = Future()
+            self._queue.put((list(texts[i:i + self.batch_size]), future))
+            futures.append(future)
+        vectors = [vector for future in futures for vector in future.result()]
+        EMBED_SECONDS.observe(time.perf_counter() - started, kind=kind)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds one query, reusing the embedding of a recently seen identical query.
+        """
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return query_embedding_cache.get_or_compute(key, lambda: self.embed([text], kind="query")[0])
+
+    def warm_up(self):
+        """
+        Starts the workers and loads the model in each of them.
+        """
+        self._ensure_started()
+        if self._pool is not None:
+            for future in [self._pool.submit(self.embed_batch, ["warm-up"]) for _ in range(self.workers)]:
+                future.result()
+        else:
+            self.embed(["warm-up"])
+
+    def _dispatch(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            size = len(item[0])
+            deadline = time.monotonic() + self.window
+            while size < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._submit(batch)
+
+    def _submit(self, batch: List[Tuple[List[str], Future]]):
+        # Embed each distinct text once
+        unique = list(dict.fromkeys(text for texts, _ in batch for text in texts))
+        EMBED_BATCH.observe(len(unique))
+        if self._pool is None:
+            try:
+                self._resolve(batch, unique, self.embed_batch(unique))
+            except Exception as e:
+                self._fail(batch, e)
+            return
+        try:
+            result = self._pool.submit(self.embed_batch, unique)
+        except Exception as e:
+            self._fail(batch, e)
+            return
+
+        def done(f: Future):
+            try:
+                self._resolve(batch, unique, f.result())
+            except Exception as e:
+                self._fail(batch, e)
+
+        result.add_done_callback(done)
+
+    @staticmethod
+    def _resolve(batch, unique: List[str], vectors: List[List[float]]):
+        by_text = dict(zip(unique, vectors))
+        for texts, future in batch:
+            future.set_result([by_text[text] for text in texts])
+
+    @staticmethod
+    def _fail(batch, error: Exception):
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def shutdown(self):
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join(timeout=5)
+                self._thread = None
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+embedding_service = EmbeddingService()
@@ -0,0 +1,148 @@
+import os
+import hashlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from .tools import get_collection
+from .embeddings import embedding_service
+
+# Chunking / batching defaults for knowledge base ingestion
+CHUNK_SIZE = int(os.environ.get("AGENTFORGE_INGEST_CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.environ.get("AGENTFORGE_INGEST_CHUNK_OVERLAP", "100"))
+BATCH_SIZE = int(os.environ.get("AGENTFORGE_INGEST_BATCH_SIZE", "64"))
+
+
+def content_id(text: str) -> str:
+    """
+    Stable id for a chunk: the same text maps to the same id in every process.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TextChunker:
+    """
+    Incremental splitter: feed text in pieces of any size and get back chunks of
+    roughly `chunk_size` characters, overlapping by up to `overlap`. Only one partial
+    chunk is ever buffered, so memory stays bounded however large the input is.
+    Splits prefer paragraph, then line, then sentence, then word boundaries.
+    """
+
+    SEPARATORS = ("\n\n", "\n", ". ", " ")
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP):
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        self.chunk_size = chunk_size
+        self.overlap = max(0, min(overlap, chunk_size // 2))
+        self._buffer = ""
+
+    def _split_point(self, text: str) -> int:
+        # Last natural boundary in the back half of the window, else a hard cut
+        window = text[:self.chunk_size]
+        for sep in self.SEPARATORS:
+            pos = window.rfind(sep)
+            if pos >= self.chunk_size // 2:
+                return pos + len(sep)
+        return self.chunk_size
+
+    def feed(self, text: str) -> List[str]:
+        chunks = []
+        # Consume large inputs a window at a time so the buffer never exceeds 2x chunk_size
+        for start in range(0, len(text), self.chunk_size):
+            self._buffer += text[start:start + self.chunk_size]
+            while len(self._buffer) > self.chunk_size:
+                cut = self._split_point(self._buffer)
+                chunk = self._buffer[:cut].strip()
+                if chunk:
+                    chunks.append(chunk)
+                # Advance at least half a chunk, even when the split came early, so overlap
+                # can't multiply the text (and embedding work) several times over
+                self._buffer = self._buffer[max(cut - self.overlap, self.chunk_size // 2, 1):]
+        return chunks
+
+    def flush(self) -> List[str]:
+        chunk, self._buffer = self._buffer.strip(), ""
+        return [chunk] if chunk else []
+
+
+def chunk_text(pieces: Iterable[str], chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> Iterator[str]:
+    """
+    Streams chunks out of an iterable of text pieces (e.g. lines of a file).
+    """
+    chunker = TextChunker(chunk_size, overlap)
+    for piece in pieces:
+        yield from chunker.feed(piece)
+    yield from chunker.flush()
+
+
+class Ingestor:
+    """
+    Batches chunks and upserts them into the knowledge base collection.
+    Chunks are deduplicated by content hash, both within the run and against
+    what is already stored. Each upsert is embedded by the embedding service.
+    """
+
+    def __init__(self, batch_size: int = BATCH_SIZE, collection=None):
+        self.batch_size = max(1, batch_size)
+        self.collection = collection or get_collection()
+        self._seen = set()
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self.stats = {"chunks": 0, "added": 0, "duplicates": 0, "batches": 0}
+
+    def add_many(self, texts: Iterable[str], metadata: Optional[Dict[str, Any]] = None):
+        for text in texts:
+            self.add(text, metadata)
+
+    def add(self, text: str, metadata: Optional[Dict[str, Any]] = None):
+        self.stats["chunks"] += 1
+        doc_id = content_id(text)
+        if doc_id in self._seen:
+            self.stats["duplicates"] += 1
+            return
+        self._seen.add(doc_id)
+        self._ids.append(doc_id)
+        self._documents.append(text)
+        self._metadatas.append(metadata or {"source": "user_input"})
+        if len(self._ids) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._ids:
+            return
+        ids, documents, metadatas = self._ids, self._documents, self._metadatas
+        self._ids, self._documents, self._metadatas = [], [], []
+
+        # Skip chunks already in the store so they aren't embedded again
+        existing = set(self.collection.get(ids=ids, include=[])["ids"])
+        if existing:
+            keep = [i for i, doc_id in enumerate(ids) if doc_id not in existing]
+            self.stats["duplicates"] += len(ids) - len(keep)
+            ids = [ids[i] for i in keep]
+            documents = [documents[i] for i in keep]
+            metadatas = [metadatas[i] for i in keep]
+        if not ids:
+            return
+
+        embeddings = embedding_service.embed(documents)
+        self.collection.upsert(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+        self.stats["added"] += len(ids)
+        self.stats["batches"] += 1
+
+
+def ingest_documents(
+    documents: Iterable[Dict[str, Any]],
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+    batch_size: int = BATCH_SIZE,
+) -> Dict[str, int]:
+    """
+    Chunks, dedupes and upserts documents ({"content": ..., "metadata": {...}}).
+    Returns ingestion counters.
+    """
+    ingestor = Ingestor(batch_size)
+    for document in documents:
+        metadata = document.get("metadata") or {"source": "user_input"}
+        for chunk in chunk_text([document["content"]], chunk_size, overlap):
+            ingestor.add(chunk, metadata)
+    ingestor.flush()
+    return ingestor.stats
@@ -1,14 +1,44 @@
-from fastapi import FastAPI, Body, HTTPException
+from fastapi import FastAPI, Body, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from .models import RunRequest, Workflow, Node
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from .models import RunRequest, BatchRunRequest, Workflow, Node, IngestRequest, CreateSessionRequest, AgentSettings
+from pydantic import BaseModel, Field, ValidationError, field_validator
 from .agents import Agent, AGENT_PROMPTS
-import json
+from .clients import close_clients
+from .tools import shutdown_tool_executor, warm_up_vector_store
+from .embeddings import embedding_service
+from .cache import cache_stats
+from .context import ContextWindow
+from .sessions import sessions
+from .sse import sse_stream
+from .metrics import REGISTRY, RUNS, RUNS_IN_PROGRESS, RUN_DURATION, RUNS_CANCELLED
+from .runs import run_manager
+from .ratelimit import limiter, PRIORITY_INTERACTIVE
+from .routing import agent_settings
+from .scheduler import WorkflowGraph, GraphError
+from .batch import BatchRunner, read_jsonl, encode_jsonl, BATCH_CONCURRENCY
+from .ingest import Ingestor, TextChunker, ingest_documents, CHUNK_SIZE, CHUNK_OVERLAP, BATCH_SIZE
+from contextlib import asynccontextmanager
+import os
+import math
+import codecs
 import asyncio
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Optional
 
-app = FastAPI(title="AgentForge Core")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.environ.get("AGENTFORGE_WARM_RAG", "").lower() in ("1", "true", "yes"):
+        # Opt-in: build the vector store and load the embedding model at boot
+        await asyncio.to_thread(warm_up_vector_store)
+    run_manager.start()
+    yield
+    await run_manager.close()
+    # Release pooled Groq connections, tool threads and embedding workers on shutdown
+    await close_clients()
+    shutdown_tool_executor()
+    embedding_service.shutdown()
+
+app = FastAPI(title="AgentForge Core", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,10 +48,109 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def check_capacity():
+    """
+    Backpressure at the API edge: refuse new work while the Groq queue is full.
+    """
+    if limiter.overloaded():
+        raise HTTPException(
+            status_code=429,
+            detail="Too many queued LLM calls, retry later.",
+            headers={"Retry-After": str(math.ceil(limiter.retry_after()))},
+        )
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Hit/miss counters and estimated latency saved for every result cache.
+    """
+    return cache_stats()
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus exposition of per-node, per-tool and per-endpoint performance metrics.
+    """
+    return PlainTextResponse(REGISTRY.exposition(), media_type="text/plain; version=0.0.4")
+
+@app.post("/ingest")
+async def ingest(request: IngestRequest = Body(...)):
+    """
+    Bulk-adds documents to the local_rag knowledge base.
+    Documents are chunked, deduped by content hash and upserted in batches.
+    """
+    documents = [d.model_dump() for d in request.documents]
+    stats = await asyncio.to_thread(
+        ingest_documents,
+        documents,
+        chunk_size=request.chunk_size or CHUNK_SIZE,
+        overlap=request.overlap if request.overlap is not None else CHUNK_OVERLAP,
+        batch_size=request.batch_size or BATCH_SIZE,
+    )
+    return {"status": "success", **stats}
+
+@app.post("/ingest/stream")
+async def ingest_stream(
+    request: Request,
+    source: str = "upload",
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+    batch_size: int = BATCH_SIZE,
+):
+    """
+    Ingests a raw UTF-8 text body of any size.
+    The body is chunked as it arrives, so memory use is bounded by the batch size.
+    """
+    if chunk_size < 50 or overlap < 0 or batch_size < 1:
+        raise HTTPException(status_code=422, detail="Invalid chunk_size, overlap or batch_size.")
+
+    ingestor = await asyncio.to_thread(Ingestor, batch_size)
+    chunker = TextChunker(chunk_size, overlap)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    metadata = {"source": source}
+
+    async for data in request.stream():
+        chunks = chunker.feed(decoder.decode(data))
+        if chunks:
+            await asyncio.to_thread(ingestor.add_many, chunks, metadata)
+
+    chunks = chunker.feed(decoder.decode(b"", final=True)) + chunker.flush()
+    await asyncio.to_thread(ingestor.add_many, chunks, metadata)
+    await asyncio.to_thread(ingestor.flush)
+    return {"status": "success", **ingestor.stats}
+
+@app.post("/sessions")
+async def create_session(request: CreateSessionRequest = Body(...)):
+    """
+    Starts a server-side run session. /run_node calls then send only the session id;
+    the server keeps the history and appends each node's output itself.
+    """
+    session = sessions.create(request.prompt, request.history)
+    return {"session_id": session.id, "ttl": sessions.ttl}
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired.")
+    return {"status": "deleted"}
+
 class RunNodeRequest(BaseModel):
     agent_config: dict
-    history: List[Dict[str, str]]
-    prompt: str
+    # Either a session id (preferred, constant-size requests) or the full history
+    session_id: Optional[str] = None
+    history: List[Dict[str, str]] = Field(default_factory=list)
+    prompt: Optional[str] = None
+    # Set to False to bypass the completion cache for this request
+    use_cache: bool = True
+    # Emit a `metrics` SSE event (TTFT, tokens/sec, tool latency...) before `end`
+    emit_metrics: bool = False
+
+    @field_validator("agent_config")
+    @classmethod
+    def check_settings(cls, value: dict) -> dict:
+        # model, fallback_model, temperature, max_tokens, latency_sensitive
+        AgentSettings.model_validate(value)
+        return value
 
 @app.post("/run_node")
 async def run_single_node(request: RunNodeRequest = Body(...)):
@@ -29,162 +158,230 @@ async def run_single_node(request: RunNodeRequest = Body(...)):
     Executes a single agent node.
     Streams logs and final result/thought.
     """
+    check_capacity()
     agent_data = request.agent_config
     agent_name = agent_data.get("name", "Unknown")
     system_prompt = agent_data.get("system_prompt", "")
-    history = request.history
+
+    session = None
+    if request.session_id:
+        session = sessions.get(request.session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found or expired.")
+        history = session.history
+    else:
+        seed = request.history or ([{"role": "user", "content": request.prompt}] if request.prompt else [])
+        history = ContextWindow(seed)
     
     async def event_generator():
-        # yield f"event: log\ndata: {json.dumps({'agent': 'System', 'text': f'Activating {agent_name}...', 'type': 'info'})}\n\n"
+        # yield "log", {'agent': 'System', 'text': f'Activating {agent_name}...', 'type': 'info'}
 
-        agent = Agent(name=agent_name, system_prompt=system_prompt)
+        agent = Agent(name=agent_name, system_prompt=system_prompt, use_cache=request.use_cache, priority=PRIORITY_INTERACTIVE, **agent_settings(agent_data))
         
-        # Pruning
-        pruned_history = history[-10:] if len(history) > 10 else history
+        # Keep the original request and as much recent history as fits the token budget
+        pruned_history = history.build(agent.context_budget())
 
         full_response = ""
+        RUNS.inc(endpoint="run_node")
+        RUNS_IN_PROGRESS.inc(endpoint="run_node")
+        stream = agent.run_stream(pruned_history)
         try:
-             async for event in agent.run_stream(pruned_history):
+             async for event in stream:
                 if event["type"] == "thought":
                     chunk = event["text"]
                     full_response += chunk
-                    sse_payload = json.dumps({
+                    yield "log", {
                         "agent": agent_name,
                         "text": chunk,
                         "type": "thought"
-                    })
-                    yield f"event: log\ndata: {sse_payload}\n\n"
+                    }
                 elif event["type"] == "error":
-                     yield f"event: log\ndata: {json.dumps({'agent': 'System', 'text': event['text'], 'type': 'error'})}\n\n"
+                     yield "log", {'agent': 'System', 'text': event['text'], 'type': 'error'}
+                elif event["type"] == "queued":
+                     yield "log", {'agent': 'System', 'text': event['text'], 'type': 'info'}
         except Exception as e:
-             yield f"event: log\ndata: {json.dumps({'agent': 'System', 'text': f'Error details: {str(e)}', 'type': 'error'})}\n\n"
-             yield f"event: end\ndata: {json.dumps({'status': 'error'})}\n\n"
+             agent.stats.errors += 1
+             yield "log", {'agent': 'System', 'text': f'Error details: {str(e)}', 'type': 'error'}
+             yield "end", {'status': 'error'}
              return
+        except (asyncio.CancelledError, GeneratorExit):
+             # Client disconnected: stop generating for nobody
+             RUNS_CANCELLED.inc(endpoint="run_node", reason="disconnect")
+             raise
+        finally:
+             await stream.aclose()
+             agent.stats.finish("run_node")
+             RUN_DURATION.observe(agent.stats.finished - agent.stats.started, endpoint="run_node")
+             RUNS_IN_PROGRESS.dec(endpoint="run_node")
+
+        if request.emit_metrics:
+            yield "metrics", {"node_id": None, **agent.stats.as_dict()}
+
+        # Session runs keep their history server-side
+        if session is not None and full_response:
+            session.append_output(agent_name, full_response)
 
         # Return final content event so frontend can append to history
-        yield f"event: end\ndata: {json.dumps({'status': 'success', 'content': full_response})}\n\n"
+        yield "end", {'status': 'success', 'content': full_response}
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    return StreamingResponse(sse_stream(event_generator()), media_type="text/event-stream")
 
 @app.post("/run")
 async def run_workflow(request: RunRequest = Body(...)):
     """
     Executes the workflow graph.
-    1. Finds start node (or first agent node).
-    2. Traverses edges sequentially.
-    3. Streams output via SSE.
+    1. Compiles the graph and orders it topologically.
+    2. Runs every node whose parents have finished, independent branches concurrently.
+    3. Streams output via SSE, each event tagged with its node id.
+    The run executes in the background: if this stream drops, re-attach with
+    GET /runs/{run_id}/events (the id is in the first `run` event and X-Run-Id)
+    within AGENTFORGE_RUN_CANCEL_GRACE seconds, or the run is cancelled.
     """
-    workflow = request.workflow
-    prompt = request.prompt
-    
+    check_capacity()
+    run_id = await run_manager.submit(request)
+
     async def event_generator():
-        yield f"event: log\ndata: {json.dumps({'agent': 'System', 'text': f'Workflow started with prompt: {prompt}', 'type': 'info'})}\n\n"
-
-        # 1. Build Graph Map
-        # node_id -> node
-        node_map = {n.id: n for n in workflow.nodes}
-        # source_id -> [target_id] (Adjacency list)
-        adj_list = {n.id: [] for n in workflow.nodes}
-        for edge in workflow.edges:
-            if edge.source in adj_list:
-                adj_list[edge.source].append(edge.target)
-
-        # 2. Find Start Node
-        # Heuristic: Node with no incoming edges or the first defined node
-        incoming_edges = set(e.target for e in workflow.edges)
-        start_nodes = [n for n in workflow.nodes if n.id not in incoming_edges]
-        
-        if not start_nodes:
-             # Cycle or all connected? Pick first.
-             current_node_id = workflow.nodes[0].id if workflow.nodes else None
-        else:
-             current_node_id = start_nodes[0].id
-
-        if not current_node_id:
-             yield f"event: log\ndata: {json.dumps({'agent': 'System', 'text': 'Error: Empty workflow.', 'type': 'error'})}\n\n"
-             return
+        events = run_manager.attach(run_id, cancel_when_detached=True)
+        try:
+            yield "run", {"run_id": run_id}
+            async for item in events:
+                yield item
+        finally:
+            await events.aclose()
 
-        # 3. Execution Loop
-        visited: Set[str] = set()
-        # Message history shared across agents (simple shared state)
-        # We prune this to keep context window manageable
-        history: List[Dict[str, str]] = [
-            {"role": "user", "content": prompt}
-        ]
-
-        while current_node_id:
-            if current_node_id in visited:
-                yield f"event: log\ndata: {json.dumps({'agent': 'System', 'text': 'Loop detected. Stopping execution.', 'type': 'error'})}\n\n"
-                break
-            visited.add(current_node_id)
-            
-            node = node_map[current_node_id]
-            node_type = node.data.get("name", "Unknown") # 'Researcher', 'Writer' etc.
-            system_prompt = node.data.get("system_prompt", "")
-            
-            yield f"event: log\ndata: {json.dumps({'agent': 'System', 'text': f'Activating {node_type}...', 'type': 'info'})}\n\n"
-
-            # Create Agent
-            # Tools are assigned in Agent.__init__ based on name (Researcher/Coder get tools)
-            agent = Agent(name=node_type, system_prompt=system_prompt)
-            
-            # Run Agent
-            # Pass recent history (pruned to last 10 messages)
-            pruned_history = history[-10:] if len(history) > 10 else history
-            
-            full_response = ""
-            async for event in agent.run_stream(pruned_history):
-                if event["type"] == "thought":
-                    chunk = event["text"]
-                    full_response += chunk
-                    # SSE format: data: <content>
-                    # We send just the text chunk for the UI log
-                    safe_chunk = chunk.replace('\n', ' ') # Simple escaping for single-line data field
-                    if safe_chunk.strip():
-                        # We send a JSON-like structure or just text. 
-                        # The UI expects distinct lines or JSON? 
-                        # UI Code: `const msg = line.replace('data: ', '').trim(); if(msg) this.addLog(msg);`
-                        # UI log handling is simple string. Let's send nicely formatted string or JSON if we change UI.
-                        # The user asked: `Streams events via SSE: {"agent": "Writer", "text": "chunk", "type": "thought"}`
-                        # So I must send structured JSON in 'data'.
-                        
-                        sse_payload = json.dumps({
-                            "agent": event["agent"],
-                            "text": chunk,
-                            "type": "thought"
-                        })
-                        yield f"event: log\ndata: {sse_payload}\n\n"
-                elif event["type"] == "error":
-                     yield f"event: log\ndata: {json.dumps({'agent': 'System', 'text': event['text'], 'type': 'error'})}\n\n"
-
-            # Append result to history for next agent
-            history.append({"role": "assistant", "content": full_response})
-            
-            # Handoff Logic / Graph Traversal
-            # Check for Handoff command? 
-            # "Detect handoff commands (e.g., 'HANDOFF_TO:Critic')"
-            if "HANDOFF_TO:" in full_response:
-                # Naive parsing
-                potential_target = full_response.split("HANDOFF_TO:")[1].split()[0].strip()
-                # Try to find a node with this name? 
-                # Or just follow the edge?
-                # User said "Executes agents sequentially via edges" BUT also "Detect handoff".
-                # I will prioritize Edge Traversal, but maybe Handoff validates it?
-                # Let's stick to explicit edges for the *visual* builder flow. 
-                # Handoff commands might be internal agent logic, but the graph drives flow.
-                pass 
-
-            # Move to next node
-            neighbors = adj_list[current_node_id]
-            if neighbors:
-                # Linear assumption: take first neighbor
-                current_node_id = neighbors[0]
+    return StreamingResponse(sse_stream(event_generator()), media_type="text/event-stream", headers={"X-Run-Id": run_id})
+
+@app.post("/runs")
+async def submit_run(request: RunRequest = Body(...)):
+    """
+    Submits a workflow to run in the background and returns its id straight away.
+    """
+    check_capacity()
+    run_id = await run_manager.submit(request)
+    return {"run_id": run_id, "status": "queued"}
+
+@app.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    run = await run_manager.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found or expired.")
+    return run
+
+@app.post("/runs/{run_id}/cancel")
+async def cancel_run(run_id: str):
+    """
+    Stops a run: in-flight LLM streams and tool calls are cancelled and nodes that
+    haven't started are skipped. Finished runs are left as they are.
+    """
+    status = await run_manager.cancel(run_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Run not found or expired.")
+    return {"run_id": run_id, "status": status}
+
+@app.get("/runs/{run_id}/events")
+async def run_events(run_id: str, request: Request, last_event_id: Optional[int] = None):
+    """
+    Streams a run's events: everything logged so far, then live until it finishes.
+    Resumes after the Last-Event-ID header (or ?last_event_id=) when given.
+    """
+    if await run_manager.get(run_id) is None:
+        raise HTTPException(status_code=404, detail="Run not found or expired.")
+    if last_event_id is None:
+        header = request.headers.get("last-event-id", "")
+        last_event_id = int(header) if header.isdigit() else 0
+
+    return StreamingResponse(sse_stream(run_manager.attach(run_id, last_event_id)), media_type="text/event-stream")
+
+def compile_batch(request: BatchRunRequest) -> BatchRunner:
+    try:
+        graph = WorkflowGraph(request.workflow)
+    except GraphError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return BatchRunner(
+        graph,
+        concurrency=request.concurrency or BATCH_CONCURRENCY,
+        max_concurrency=request.max_concurrency,
+        use_cache=request.use_cache,
+    )
+
+@app.post("/run_batch")
+async def run_batch(request: BatchRunRequest = Body(...)):
+    """
+    Runs one workflow over many prompts. The graph is compiled once and items run
+    with bounded concurrency; each item's result is streamed as a JSON line as soon
+    as it finishes (in completion order, with its `index`), followed by a summary line.
+    """
+    check_capacity()
+    runner = compile_batch(request)
+
+    async def prompts():
+        for prompt in request.prompts:
+            yield prompt, None
+
+    runner.start()
+    feeder = asyncio.create_task(runner.feed(prompts()))
+
+    async def results():
+        try:
+            async for item in runner.results():
+                yield item
+        finally:
+            feeder.cancel()
+
+    return StreamingResponse(encode_jsonl(results()), media_type="application/x-ndjson")
+
+@app.post("/run_batch/stream")
+async def run_batch_stream(request: Request):
+    """
+    JSON Lines variant of /run_batch for large batches. The first line holds the
+    /run_batch options (workflow, concurrency...); every further line is a prompt,
+    either a JSON string or {"prompt": ..., "id": ...}. Items start running while
+    the body is still uploading; results stream back as soon as it has been read.
+    """
+    check_capacity()
+    lines = read_jsonl(request.stream())
+    try:
+        options = BatchRunRequest.model_validate(await lines.__anext__())
+    except StopAsyncIteration:
+        raise HTTPException(status_code=422, detail="Empty body: the first line must hold the workflow.")
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    runner = compile_batch(options)
+    runner.start()
+
+    # Unbounded buffer between the upload and the runner's bounded inbox, so reading
+    # the body (and starting the response) never waits on items finishing
+    buffer: asyncio.Queue = asyncio.Queue()
+
+    async def prompts():
+        while True:
+            item = await buffer.get()
+            if item is None:
+                return
+            yield item
+
+    feeder = asyncio.create_task(runner.feed(prompts()))
+    try:
+        for prompt in options.prompts:
+            buffer.put_nowait((prompt, None))
+        async for line in lines:
+            if isinstance(line, dict):
+                buffer.put_nowait((line.get("prompt"), line.get("id")))
             else:
-                current_node_id = None
-                
-            yield f"event: log\ndata: {json.dumps({'agent': 'System', 'text': f'{node_type} finished.', 'type': 'info'})}\n\n"
-            
-        yield f"event: log\ndata: {json.dumps({'agent': 'System', 'text': 'Workflow completed.', 'type': 'success'})}\n\n"
-        yield "event: end\ndata: \n\n"
-
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+                buffer.put_nowait((line, None))
+        buffer.put_nowait(None)
+    except BaseException:
+        # Upload failed or the client went away
+        feeder.cancel()
+        await runner.abort()
+        raise
+
+    async def results():
+        try:
+            async for item in runner.results():
+                yield item
+        finally:
+            feeder.cancel()
+
+    return StreamingResponse(encode_jsonl(results()), media_type="application/x-ndjson")
+
@@ -0,0 +1,247 @@
+import time
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Minimal Prometheus-style metrics (text exposition format 0.0.4), no client library needed
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (10, 25, 50, 100, 200, 300, 500, 750, 1000, 1500, 2000)
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_number(v)}" for key, v in values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> (bucket counts, sum, count)
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(e[0]), e[1], e[2]) for key, e in self._values.items()}
+        lines = self.header()
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        # Callbacks producing extra exposition lines at scrape time (e.g. cache counters)
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[str]]):
+        self._collectors.append(collector)
+
+    def exposition(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+LLM_REQUESTS = REGISTRY.register(Counter("agentforge_llm_requests_total", "LLM completion calls.", ("agent", "model", "status")))
+LLM_TTFT = REGISTRY.register(Histogram("agentforge_llm_ttft_seconds", "Time from request to first streamed token or tool call.", ("agent", "model")))
+LLM_TOKENS = REGISTRY.register(Counter("agentforge_llm_completion_tokens_total", "Streamed completion tokens.", ("agent", "model")))
+LLM_TOKEN_RATE = REGISTRY.register(Histogram("agentforge_llm_tokens_per_second", "Completion streaming rate after the first token.", ("agent", "model"), RATE_BUCKETS))
+LLM_RETRIES = REGISTRY.register(Counter("agentforge_llm_retries_total", "LLM calls retried after a 429, 5xx or connection error.", ("model", "reason")))
+LLM_QUEUE_DEPTH = REGISTRY.register(Gauge("agentforge_llm_queue_depth", "LLM calls waiting for rate limit capacity."))
+MODEL_FALLBACKS = REGISTRY.register(Counter("agentforge_llm_fallbacks_total", "Calls moved to the fallback model.", ("model", "fallback", "reason")))
+NODE_DURATION = REGISTRY.register(Histogram("agentforge_node_duration_seconds", "Wall time of one agent node.", ("agent", "endpoint")))
+NODE_ROUND_TRIPS = REGISTRY.register(Histogram("agentforge_node_llm_round_trips", "LLM calls made by one node (1 + tool turns).", ("agent",), COUNT_BUCKETS))
+NODE_ERRORS = REGISTRY.register(Counter("agentforge_node_errors_total", "Nodes that reported an error.", ("agent", "endpoint")))
+QUEUE_WAIT = REGISTRY.register(Histogram("agentforge_queue_wait_seconds", "Time a node or LLM call waited before it could start.", ("stage",)))
+TOOL_DURATION = REGISTRY.register(Histogram("agentforge_tool_duration_seconds", "Tool call latency.", ("tool",)))
+TOOL_CALLS = REGISTRY.register(Counter("agentforge_tool_calls_total", "Tool calls by outcome.", ("tool", "status")))
+EMBED_BATCH = REGISTRY.register(Histogram("agentforge_embedding_batch_size", "Distinct texts per embedding batch.", (), BATCH_BUCKETS))
+EMBED_SECONDS = REGISTRY.register(Histogram("agentforge_embedding_seconds", "Embedding latency per request, including time spent waiting for a batch.", ("kind",)))
+RUNS = REGISTRY.register(Counter("agentforge_runs_total", "Run requests by endpoint.", ("endpoint",)))
+RUNS_IN_PROGRESS = REGISTRY.register(Gauge("agentforge_runs_in_progress", "Runs currently streaming.", ("endpoint",)))
+RUN_DURATION = REGISTRY.register(Histogram("agentforge_run_duration_seconds", "End-to-end run duration.", ("endpoint",)))
+RUNS_CANCELLED = REGISTRY.register(Counter("agentforge_runs_cancelled_total", "Runs stopped before they finished.", ("endpoint", "reason")))
+
+
+def _cache_lines() -> List[str]:
+    from .cache import cache_stats
+    lines = [
+        "# HELP agentforge_cache_lookups_total Result cache lookups by outcome.",
+        "# TYPE agentforge_cache_lookups_total counter",
+    ]
+    for name, stats in cache_stats().items():
+        for outcome in ("hits", "disk_hits", "misses", "coalesced"):
+            lines.append(f'agentforge_cache_lookups_total{{cache="{_escape(name)}",outcome="{outcome}"}} {stats[outcome]}')
+    return lines
+
+
+REGISTRY.register_collector(_cache_lines)
+
+
+class NodeStats:
+    """
+    Per-node performance counters filled in by Agent.run_stream.
+    """
+
+    def __init__(self, agent: str, model: str):
+        self.agent = agent
+        self.model = model
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.tokens = 0
+        self.stream_seconds = 0.0
+        self.round_trips = 0
+        self.fallbacks = 0
+        self.tool_calls = 0
+        self.tool_errors = 0
+        self.tool_seconds = 0.0
+        self.queue_wait = 0.0
+        self.errors = 0
+
+    def observe_completion(self, requested: float, first_token: Optional[float], tokens: int, status: str = "ok", model: Optional[str] = None):
+        """
+        Records one LLM round trip (request time, first token time, streamed tokens).
+        `model` is the model that actually answered, if it was a fallback.
+        """
+        now = time.perf_counter()
+        model = model or self.model
+        if model != self.model:
+            self.fallbacks += 1
+        self.round_trips += 1
+        self.tokens += tokens
+        LLM_REQUESTS.inc(agent=self.agent, model=model, status=status)
+        if first_token is not None:
+            ttft = first_token - requested
+            if self.ttft is None:
+                self.ttft = ttft
+            LLM_TTFT.observe(ttft, agent=self.agent, model=model)
+            self.stream_seconds += now - first_token
+            if tokens and now > first_token:
+                LLM_TOKEN_RATE.observe(tokens / (now - first_token), agent=self.agent, model=model)
+        if tokens:
+            LLM_TOKENS.inc(tokens, agent=self.agent, model=model)
+
+    def observe_tool(self, seconds: float, error: bool):
+        self.tool_calls += 1
+        self.tool_seconds += seconds
+        if error:
+            self.tool_errors += 1
+
+    def finish(self, endpoint: str):
+        self.finished = time.perf_counter()
+        NODE_DURATION.observe(self.finished - self.started, agent=self.agent, endpoint=endpoint)
+        NODE_ROUND_TRIPS.observe(self.round_trips, agent=self.agent)
+        if self.errors:
+            NODE_ERRORS.inc(agent=self.agent, endpoint=endpoint)
+
+    def as_dict(self) -> Dict[str, object]:
+        end = self.finished or time.perf_counter()
+        return {
+            "agent": self.agent,
+            "model": self.model,
+            "duration_ms": round((end - self.started) * 1000, 1),
+            "ttft_ms": round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            "tokens": self.tokens,
+            "tokens_per_sec": round(self.tokens / self.stream_seconds, 1) if self.stream_seconds else None,
+            "llm_round_trips": self.round_trips,
+            "fallbacks": self.fallbacks,
+            "tool_calls": self.tool_calls,
+            "tool_errors": self.tool_errors,
+            "tool_ms": round(self.tool_seconds * 1000, 1),
+            "queue_wait_ms": round(self.queue_wait * 1000, 1),
+            "errors": self.errors,
+        }
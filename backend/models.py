@@ -1,12 +1,31 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Dict, Optional, Any, Literal
 
+class AgentSettings(BaseModel):
+    """
+    Optional per-node LLM settings, read from Node.data (or /run_node's agent_config).
+    Unset fields fall back to the routing defaults (see routing.py).
+    """
+    model: Optional[str] = None
+    # Used when `model` is rate limited or slow to produce its first token
+    fallback_model: Optional[str] = None
+    temperature: Optional[float] = Field(default=None, ge=0, le=2)
+    max_tokens: Optional[int] = Field(default=None, ge=1)
+    # Route to the fast model unless `model` is set (defaults by role)
+    latency_sensitive: Optional[bool] = None
+
 class Node(BaseModel):
     id: str
     type: str  # 'agent', 'start', 'end' etc.
     data: Dict[str, Any] = Field(default_factory=dict)
     position: Dict[str, float] = Field(default_factory=dict)
 
+    @model_validator(mode="after")
+    def check_settings(self):
+        # Reject bad model settings up front (422) instead of failing mid-run
+        AgentSettings.model_validate(self.data)
+        return self
+
 class Edge(BaseModel):
     id: str
     source: str
@@ -20,3 +39,34 @@ class RunRequest(BaseModel):
     workflow: Workflow
     prompt: str
     context: Optional[str] = ""
+    # Upper bound on nodes running at once (defaults to AGENTFORGE_MAX_CONCURRENCY)
+    max_concurrency: Optional[int] = Field(default=None, ge=1)
+    # Set to False to bypass the completion cache for this run
+    use_cache: bool = True
+    # Emit a `metrics` SSE event (TTFT, tokens/sec, tool latency...) after each node
+    emit_metrics: bool = False
+
+class BatchRunRequest(BaseModel):
+    workflow: Workflow
+    prompts: List[str] = Field(default_factory=list)
+    # Items running at once (defaults to AGENTFORGE_BATCH_CONCURRENCY)
+    concurrency: Optional[int] = Field(default=None, ge=1)
+    # Upper bound on nodes running at once within one item
+    max_concurrency: Optional[int] = Field(default=None, ge=1)
+    use_cache: bool = True
+
+class IngestDocument(BaseModel):
+    content: str
+    metadata: Dict[str, Any] = Field(default_factory=lambda: {"source": "user_input"})
+
+class IngestRequest(BaseModel):
+    documents: List[IngestDocument]
+    # Defaults come from the AGENTFORGE_INGEST_* settings
+    chunk_size: Optional[int] = Field(default=None, ge=50)
+    overlap: Optional[int] = Field(default=None, ge=0)
+    batch_size: Optional[int] = Field(default=None, ge=1)
+
+class CreateSessionRequest(BaseModel):
+    prompt: str
+    # Optional seed history (e.g. to resume after a session expired)
+    history: Optional[List[Dict[str, str]]] = None
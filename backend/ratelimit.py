@@ -0,0 +1,227 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+from typing import List, Optional
+import groq
+from .metrics import LLM_QUEUE_DEPTH, LLM_RETRIES, QUEUE_WAIT
+
+# Process-wide admission control for Groq completions.
+# Budgets mirror the account's rate limits; 0 disables a budget
+REQUESTS_PER_MINUTE = float(os.environ.get("AGENTFORGE_GROQ_RPM", "0"))
+TOKENS_PER_MINUTE = float(os.environ.get("AGENTFORGE_GROQ_TPM", "0"))
+# Queued calls beyond which the API answers 429 instead of accepting more work (0 = no limit)
+MAX_QUEUE = int(os.environ.get("AGENTFORGE_LLM_MAX_QUEUE", "0"))
+# How often a queued call reports its position to the client
+QUEUE_NOTICE_SECONDS = float(os.environ.get("AGENTFORGE_LLM_QUEUE_NOTICE", "2"))
+# Retries of 429s, 5xx and connection errors (the Groq SDK's own retries are disabled)
+MAX_RETRIES = int(os.environ.get("AGENTFORGE_GROQ_MAX_RETRIES", "4"))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+# Lower runs first: interactive /run_node calls go ahead of workflow runs,
+# which go ahead of /run_batch items
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_BULK = 2
+
+RETRYABLE_ERRORS = (groq.RateLimitError, groq.InternalServerError, groq.APIConnectionError)
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute, holding at most one minute's worth.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Seconds until `amount` units are available (0 if they are now).
+        """
+        self._refill(now)
+        amount = min(amount, self.capacity)  # an oversized call waits for a full bucket, not forever
+        return max(amount - self.level, 0) / self.rate
+
+    def take(self, amount: float):
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount: float):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class Ticket:
+    """
+    One queued completion call. `granted` resolves when it may be sent.
+    """
+
+    def __init__(self, tokens: int, priority: int, seq: int, granted: asyncio.Future):
+        self.tokens = tokens
+        self.priority = priority
+        self.seq = seq
+        self.granted = granted
+        self.enqueued = time.perf_counter()
+        self.cancelled = False
+
+    def __lt__(self, other: "Ticket") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RateLimiter:
+    """
+    Priority queue in front of chat.completions.create, released against
+    requests-per-minute and tokens-per-minute token buckets. Calls are charged
+    their estimated prompt tokens plus max_tokens up front; unused tokens are
+    refunded by settle() once the completion has finished.
+    """
+
+    def __init__(self, rpm: float = REQUESTS_PER_MINUTE, tpm: float = TOKENS_PER_MINUTE, max_queue: int = MAX_QUEUE):
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_queue = max_queue
+        self._queue: List[Ticket] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for t in self._queue if not t.cancelled)
+
+    def overloaded(self) -> bool:
+        return self.max_queue > 0 and self.depth >= self.max_queue
+
+    def retry_after(self) -> float:
+        """
+        Rough seconds until the current queue drains, for Retry-After headers.
+        """
+        waits = [max(self._paused_until - time.monotonic(), 0)]
+        if self.requests is not None:
+            waits.append(self.depth / self.requests.rate)
+        if self.tokens is not None:
+            waits.append(sum(t.tokens for t in self._queue if not t.cancelled) / self.tokens.rate)
+        return max(waits + [1.0])
+
+    def submit(self, tokens: int, priority: int = PRIORITY_BATCH) -> Ticket:
+        loop = asyncio.get_running_loop()
+        ticket = Ticket(tokens, priority, next(self._seq), loop.create_future())
+        # Without budgets calls go straight through, unless a 429 is holding the queue
+        if not self.enabled and self._paused_until <= time.monotonic():
+            ticket.granted.set_result(None)
+            return ticket
+        heapq.heappush(self._queue, ticket)
+        LLM_QUEUE_DEPTH.set(self.depth)
+        self._ensure_dispatcher(loop)
+        self._wakeup.set()
+        return ticket
+
+    def position(self, ticket: Ticket) -> int:
+        """
+        1-based place of a waiting ticket in the queue (0 once granted).
+        """
+        if ticket.granted.done():
+            return 0
+        return 1 + sum(1 for t in self._queue if not t.cancelled and t < ticket)
+
+    def cancel(self, ticket: Ticket):
+        # Lazily removed by the dispatcher
+        if not ticket.granted.done():
+            ticket.cancelled = True
+            ticket.granted.cancel()
+            LLM_QUEUE_DEPTH.set(self.depth)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def settle(self, ticket: Ticket, used_tokens: int):
+        """
+        Refunds the part of a call's token estimate it didn't use.
+        """
+        if self.tokens is not None and ticket.tokens > used_tokens:
+            self.tokens.give(ticket.tokens - used_tokens)
+            self._wakeup.set()
+
+    def throttle(self, seconds: float):
+        """
+        Holds every queued call for `seconds` (after Groq answered 429).
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _ensure_dispatcher(self, loop: asyncio.AbstractEventLoop):
+        if self._dispatcher is None or self._dispatcher.done() or self._dispatcher.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    def _wait_time(self, ticket: Ticket, now: float) -> float:
+        wait = self._paused_until - now
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(ticket.tokens, now))
+        return wait
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            timeout = None
+            while self._queue:
+                ticket = self._queue[0]
+                if ticket.cancelled:
+                    heapq.heappop(self._queue)
+                    continue
+                wait = self._wait_time(ticket, time.monotonic())
+                if wait > 0:
+                    timeout = wait
+                    break
+                heapq.heappop(self._queue)
+                if self.requests is not None:
+                    self.requests.take(1)
+                if self.tokens is not None:
+                    self.tokens.take(ticket.tokens)
+                QUEUE_WAIT.observe(time.perf_counter() - ticket.enqueued, stage="llm")
+                ticket.granted.set_result(None)
+            LLM_QUEUE_DEPTH.set(self.depth)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """
+    Backoff before retry number `attempt` (0-based): the server's Retry-After
+    when it sent one, otherwise exponential backoff with full jitter.
+    """
+    response = getattr(error, "response", None)
+    headers = response.headers if response is not None else {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            value = float(headers.get(header, "")) * scale
+        except ValueError:
+            continue
+        if 0 < value <= BACKOFF_MAX:
+            # A little jitter so throttled callers don't all return at once
+            return value + random.uniform(0, BACKOFF_BASE)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def record_retry(model: str, error: Exception):
+    reason = "rate_limited" if isinstance(error, groq.RateLimitError) else "server_error"
+    LLM_RETRIES.inc(model=model, reason=reason)
+
+
+limiter = RateLimiter()
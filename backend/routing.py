@@ -0,0 +1,54 @@
+import os
+from typing import Any, Dict, Optional
+from .models import AgentSettings
+from .context import MODEL_CONTEXT_WINDOWS, DEFAULT_CONTEXT_WINDOW
+
+# Model routing: which Groq model each node calls, and what it falls back to
+DEFAULT_MODEL = os.environ.get("AGENTFORGE_DEFAULT_MODEL", "llama3-70b-8192")
+FAST_MODEL = os.environ.get("AGENTFORGE_FAST_MODEL", "llama-3.1-8b-instant")
+# Roles that default to FAST_MODEL (nodes can opt in/out with `latency_sensitive`)
+FAST_ROLES = {r.strip() for r in os.environ.get("AGENTFORGE_FAST_ROLES", "Critic").split(",") if r.strip()}
+# Hedge with the fallback model when the primary's first token takes longer than this (0 = only on 429)
+FALLBACK_TTFT_MS = float(os.environ.get("AGENTFORGE_FALLBACK_TTFT_MS", "2500"))
+# Context a node's max_tokens must leave for the prompt (larger values are clamped)
+MIN_PROMPT_TOKENS = 1024
+
+
+def _parse_fallbacks(value: str) -> Dict[str, str]:
+    """
+    Parses "primary=fallback,primary2=fallback2".
+    """
+    fallbacks = {}
+    for pair in value.split(","):
+        if "=" in pair:
+            primary, fallback = pair.split("=", 1)
+            fallbacks[primary.strip()] = fallback.strip()
+    return fallbacks
+
+
+MODEL_FALLBACKS = _parse_fallbacks(os.environ.get(
+    "AGENTFORGE_MODEL_FALLBACKS",
+    "llama3-70b-8192=llama-3.1-8b-instant,llama-3.3-70b-versatile=llama-3.1-8b-instant",
+))
+
+
+def agent_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Agent keyword arguments (model, fallback_model and any temperature/max_tokens
+    override) for a node's data / agent_config.
+    """
+    settings = AgentSettings.model_validate(config)
+    fast = settings.latency_sensitive
+    if fast is None:
+        fast = config.get("name") in FAST_ROLES
+
+    model = settings.model or (FAST_MODEL if fast else DEFAULT_MODEL)
+    fallback: Optional[str] = settings.fallback_model or MODEL_FALLBACKS.get(model)
+    kwargs: Dict[str, Any] = {"model": model, "fallback_model": fallback if fallback != model else None}
+    if settings.temperature is not None:
+        kwargs["temperature"] = settings.temperature
+    if settings.max_tokens is not None:
+        # The same limit is sent to the fallback, so it has to fit both windows
+        window = min(MODEL_CONTEXT_WINDOWS.get(m, DEFAULT_CONTEXT_WINDOW) for m in (model, kwargs["fallback_model"]) if m)
+        kwargs["max_tokens"] = min(settings.max_tokens, window - MIN_PROMPT_TOKENS)
+    return kwargs
@@ -0,0 +1,662 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+from .models import RunRequest
+from .scheduler import WorkflowGraph, GraphError, execute_graph
+from .metrics import RUNS, RUNS_IN_PROGRESS, RUN_DURATION, RUNS_CANCELLED
+
+# Background run engine
+# A run executes as a task on the worker that accepted it, independent of any HTTP
+# request. Its events go to a bounded, id-numbered log in a pluggable store, so
+# clients can attach, detach and resume with Last-Event-ID.
+RUN_STORE = os.environ.get("AGENTFORGE_RUN_STORE", "memory")  # 'memory' or 'sqlite'
+RUN_STORE_PATH = os.environ.get("AGENTFORGE_RUN_STORE_PATH", "agentforge_runs.db")
+RUN_LOG_SIZE = int(os.environ.get("AGENTFORGE_RUN_LOG_SIZE", "10000"))
+RUN_TTL = float(os.environ.get("AGENTFORGE_RUN_TTL", "3600"))
+MAX_RUNS = int(os.environ.get("AGENTFORGE_MAX_RUNS", "1000"))
+# A /run whose stream dropped is cancelled unless a client re-attaches within this many seconds
+RUN_CANCEL_GRACE = float(os.environ.get("AGENTFORGE_RUN_CANCEL_GRACE", "5"))
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+# (event id, event name, payload)
+LogEntry = Tuple[int, str, Optional[Dict[str, Any]]]
+
+
+async def workflow_items(request: RunRequest) -> AsyncGenerator[Tuple[str, Optional[Dict[str, Any]]], None]:
+    """
+    Executes a workflow and yields the (event, payload) items streamed to clients.
+    Raises GraphError (after the start log) if the workflow can't be run.
+    """
+    workflow = request.workflow
+    prompt = request.prompt
+
+    yield "log", {'agent': 'System', 'text': f'Workflow started with prompt: {prompt}', 'type': 'info'}
+
+    # 1. Build Graph (node map, adjacency, topological order)
+    graph = WorkflowGraph(workflow)
+
+    # 2. Execute ready nodes concurrently
+    started = time.perf_counter()
+    RUNS.inc(endpoint="run")
+    RUNS_IN_PROGRESS.inc(endpoint="run")
+    try:
+        async for event in execute_graph(graph, prompt, max_concurrency=request.max_concurrency, use_cache=request.use_cache):
+            if event["type"] == "thought":
+                # Skip whitespace-only chunks to keep the UI log readable
+                if not event["text"].strip():
+                    continue
+                yield "log", {
+                    "agent": event["agent"],
+                    "text": event["text"],
+                    "type": "thought",
+                    "node_id": event["node_id"]
+                }
+            elif event["type"] == "error":
+                yield "log", {'agent': 'System', 'text': event['text'], 'type': 'error', 'node_id': event['node_id']}
+            elif event["type"] == "queued":
+                yield "log", {'agent': 'System', 'text': f"{event['agent']}: {event['text']}", 'type': 'info', 'node_id': event['node_id']}
+            elif event["type"] == "metrics":
+                if request.emit_metrics:
+                    yield "metrics", {"node_id": event["node_id"], **event["metrics"]}
+            elif event["agent"] == "System":
+                yield "log", event
+    finally:
+        RUN_DURATION.observe(time.perf_counter() - started, endpoint="run")
+        RUNS_IN_PROGRESS.dec(endpoint="run")
+
+    yield "log", {'agent': 'System', 'text': 'Workflow completed.', 'type': 'success'}
+    yield "end", None
+
+
+class RunStore:
+    """
+    Storage for run metadata and event logs. Implementations: InMemoryRunStore
+    (single worker) and SQLiteRunStore (shared by every worker on the host).
+    """
+
+    # Whether other workers can see (and take over) this worker's runs
+    shared = False
+
+    async def create(self, run_id: str, request: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def append(self, run_id: str, event: str, payload: Optional[Dict[str, Any]]) -> int:
+        raise NotImplementedError
+
+    async def set_status(self, run_id: str, status: str):
+        raise NotImplementedError
+
+    async def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def events(self, run_id: str, after: int, limit: int = 500) -> List[LogEntry]:
+        raise NotImplementedError
+
+    async def wait(self, run_id: str, after: int, timeout: float):
+        """
+        Returns once events after `after` may be available, or after `timeout` seconds.
+        """
+        raise NotImplementedError
+
+    async def claim_orphans(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Takes over runs whose worker stopped heartbeating. Returns (run id, request).
+        """
+        return []
+
+    async def request_cancel(self, run_id: str):
+        """
+        Asks the worker executing a run to cancel it (runs on this worker are cancelled directly).
+        """
+
+    async def cancel_requests(self, run_ids: List[str]) -> List[str]:
+        """
+        Which of these runs (executed here) another worker asked to cancel.
+        """
+        return []
+
+    async def touch(self, run_id: str):
+        """
+        Records that a client on this worker is following a run executed elsewhere.
+        """
+
+    async def attached_since(self, run_id: str, since: float) -> bool:
+        """
+        Whether a client on another worker followed the run after `since` (epoch seconds).
+        """
+        return False
+
+    async def release(self, run_ids: List[str]):
+        """
+        Gives up ownership of unfinished runs (on shutdown) so another worker claims and
+        restarts them. Only meaningful for stores shared between workers.
+        """
+
+    async def close(self):
+        pass
+
+
+class InMemoryRunStore(RunStore):
+    def __init__(self, log_size: int = RUN_LOG_SIZE, ttl: float = RUN_TTL, max_runs: int = MAX_RUNS):
+        self.log_size = log_size
+        self.ttl = ttl
+        self.max_runs = max_runs
+        self._runs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def _evict(self):
+        # Drop finished runs past their TTL, then the oldest finished ones over the cap
+        now = time.time()
+        for run_id in list(self._runs):
+            meta = self._runs[run_id]["meta"]
+            finished = meta["status"] in TERMINAL_STATUSES
+            expired = finished and now - meta["updated_at"] > self.ttl
+            if expired or (finished and len(self._runs) > self.max_runs):
+                del self._runs[run_id]
+
+    async def create(self, run_id: str, request: Dict[str, Any]):
+        self._evict()
+        now = time.time()
+        self._runs[run_id] = {
+            "meta": {"run_id": run_id, "status": "queued", "created_at": now, "updated_at": now, "last_event_id": 0},
+            "log": deque(maxlen=self.log_size),
+            "changed": asyncio.Event(),
+        }
+
+    async def append(self, run_id: str, event: str, payload: Optional[Dict[str, Any]]) -> int:
+        run = self._runs[run_id]
+        event_id = run["meta"]["last_event_id"] + 1
+        run["meta"]["last_event_id"] = event_id
+        run["log"].append((event_id, event, payload))
+        # Wake every waiter, then arm a fresh event for the next append
+        changed, run["changed"] = run["changed"], asyncio.Event()
+        changed.set()
+        return event_id
+
+    async def set_status(self, run_id: str, status: str):
+        run = self._runs[run_id]
+        run["meta"]["status"] = status
+        run["meta"]["updated_at"] = time.time()
+        changed, run["changed"] = run["changed"], asyncio.Event()
+        changed.set()
+
+    async def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        run = self._runs.get(run_id)
+        return dict(run["meta"]) if run else None
+
+    async def events(self, run_id: str, after: int, limit: int = 500) -> List[LogEntry]:
+        run = self._runs.get(run_id)
+        if not run:
+            return []
+        log = run["log"]
+        if not log or log[-1][0] <= after:
+            return []
+        # Ids are contiguous, so index straight into the deque
+        start = max(after - log[0][0] + 1, 0)
+        return [log[i] for i in range(start, min(start + limit, len(log)))]
+
+    async def wait(self, run_id: str, after: int, timeout: float):
+        run = self._runs.get(run_id)
+        if not run or run["meta"]["last_event_id"] > after:
+            return
+        try:
+            await asyncio.wait_for(run["changed"].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class SQLiteRunStore(RunStore):
+    """
+    Run store in a SQLite file shared by all workers on a host. Appends are buffered
+    and written in batches; workers that don't own a run poll for new events.
+    Each worker heartbeats the runs it executes so another worker can take over
+    runs whose owner died (or released them on shutdown).
+    """
+
+    shared = True
+
+    FLUSH_INTERVAL = 0.1
+    POLL_INTERVAL = 0.25
+    HEARTBEAT_INTERVAL = 5.0
+    STALE_AFTER = 30.0
+
+    def __init__(self, path: str = RUN_STORE_PATH, log_size: int = RUN_LOG_SIZE, ttl: float = RUN_TTL):
+        self.path = path
+        self.log_size = log_size
+        self.ttl = ttl
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL, "
+                "owner TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL, heartbeat REAL NOT NULL, "
+                "cancel_requested INTEGER NOT NULL DEFAULT 0, attached_at REAL NOT NULL DEFAULT 0)"
+            )
+            # Databases created before run cancellation / cross-worker attach existed
+            for column in ("cancel_requested INTEGER NOT NULL DEFAULT 0", "attached_at REAL NOT NULL DEFAULT 0"):
+                try:
+                    self._conn.execute(f"ALTER TABLE runs ADD COLUMN {column}")
+                except sqlite3.OperationalError:
+                    pass
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS run_events (run_id TEXT NOT NULL, id INTEGER NOT NULL, event TEXT NOT NULL, "
+                "payload TEXT, PRIMARY KEY (run_id, id))"
+            )
+        # Runs executed by this worker: next id, unflushed rows, change notification
+        self._local: Dict[str, Dict[str, Any]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_heartbeat = 0.0
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            await self._flush()
+            if time.time() - self._last_heartbeat > self.HEARTBEAT_INTERVAL:
+                await self._heartbeat()
+
+    async def _flush(self, run_id: Optional[str] = None):
+        batches = []
+        for rid, local in list(self._local.items()):
+            if (run_id is None or rid == run_id) and local["pending"]:
+                batches.append((rid, local, list(local["pending"])))
+        if not batches:
+            return
+
+        def write():
+            with self._lock, self._conn:
+                for rid, _, rows in batches:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO run_events (run_id, id, event, payload) VALUES (?, ?, ?, ?)",
+                        [(rid, i, e, json.dumps(p) if p is not None else None) for i, e, p in rows],
+                    )
+                    # Keep the log bounded
+                    self._conn.execute("DELETE FROM run_events WHERE run_id = ? AND id <= ?", (rid, rows[-1][0] - self.log_size))
+
+        await asyncio.to_thread(write)
+        for _, local, rows in batches:
+            del local["pending"][:len(rows)]
+
+    async def _heartbeat(self):
+        self._last_heartbeat = now = time.time()
+        owned = [rid for rid, local in self._local.items() if not local["finished"]]
+        if owned:
+            await asyncio.to_thread(lambda: [
+                self._execute("UPDATE runs SET heartbeat = ? WHERE run_id = ? AND owner = ?", (now, rid, self.worker_id))
+                for rid in owned
+            ])
+
+    def _adopt(self, run_id: str, last_event_id: int):
+        self._local[run_id] = {"next_id": last_event_id + 1, "pending": [], "changed": asyncio.Event(), "finished": False}
+        self._ensure_flusher()
+
+    def _notify(self, run_id: str):
+        local = self._local[run_id]
+        changed, local["changed"] = local["changed"], asyncio.Event()
+        changed.set()
+
+    async def create(self, run_id: str, request: Dict[str, Any]):
+        now = time.time()
+        await asyncio.to_thread(self._purge, now)
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO runs (run_id, status, request, owner, created_at, updated_at, heartbeat) VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+            (run_id, json.dumps(request), self.worker_id, now, now, now),
+        )
+        self._adopt(run_id, 0)
+
+    def _purge(self, now: float):
+        expired = self._execute(
+            "SELECT run_id FROM runs WHERE status IN ('completed', 'failed', 'cancelled') AND updated_at < ?", (now - self.ttl,)
+        )
+        for (run_id,) in expired:
+            self._execute("DELETE FROM run_events WHERE run_id = ?", (run_id,))
+            self._execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+
+    async def append(self, run_id: str, event: str, payload: Optional[Dict[str, Any]]) -> int:
+        local = self._local[run_id]
+        event_id = local["next_id"]
+        local["next_id"] += 1
+        local["pending"].append((event_id, event, payload))
+        self._notify(run_id)
+        return event_id
+
+    async def set_status(self, run_id: str, status: str):
+        # Flush first so a reader that sees a final status also sees every event
+        await self._flush(run_id)
+        await asyncio.to_thread(
+            self._execute, "UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?", (status, time.time(), run_id)
+        )
+        local = self._local.get(run_id)
+        if local is not None:
+            local["finished"] = status in TERMINAL_STATUSES
+            self._notify(run_id)
+            if local["finished"]:
+                del self._local[run_id]
+
+    async def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT r.status, r.created_at, r.updated_at, r.owner, (SELECT MAX(id) FROM run_events e WHERE e.run_id = r.run_id) "
+            "FROM runs r WHERE r.run_id = ?",
+            (run_id,),
+        )
+        if not rows:
+            return None
+        status, created_at, updated_at, owner, last_event_id = rows[0]
+        local = self._local.get(run_id)
+        if local is not None:
+            last_event_id = local["next_id"] - 1
+        return {
+            "run_id": run_id, "status": status, "created_at": created_at, "updated_at": updated_at,
+            "last_event_id": last_event_id or 0, "worker": owner,
+        }
+
+    async def events(self, run_id: str, after: int, limit: int = 500) -> List[LogEntry]:
+        # Snapshot unflushed rows before reading the table so a concurrent flush can't hide any
+        local = self._local.get(run_id)
+        pending = [row for row in local["pending"] if row[0] > after] if local else []
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT id, event, payload FROM run_events WHERE run_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (run_id, after, limit),
+        )
+        entries = {i: (i, e, json.loads(p) if p is not None else None) for i, e, p in rows}
+        for row in pending:
+            entries.setdefault(row[0], row)
+        return [entries[i] for i in sorted(entries)][:limit]
+
+    async def wait(self, run_id: str, after: int, timeout: float):
+        local = self._local.get(run_id)
+        if local is None:
+            # Owned by another worker: poll
+            await asyncio.sleep(min(timeout, self.POLL_INTERVAL))
+            return
+        if local["next_id"] - 1 > after:
+            return
+        try:
+            await asyncio.wait_for(local["changed"].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def request_cancel(self, run_id: str):
+        await asyncio.to_thread(self._execute, "UPDATE runs SET cancel_requested = 1 WHERE run_id = ?", (run_id,))
+
+    async def cancel_requests(self, run_ids: List[str]) -> List[str]:
+        if not run_ids:
+            return []
+        marks = ",".join("?" * len(run_ids))
+        rows = await asyncio.to_thread(
+            self._execute, f"SELECT run_id FROM runs WHERE cancel_requested = 1 AND run_id IN ({marks})", tuple(run_ids)
+        )
+        return [run_id for (run_id,) in rows]
+
+    async def touch(self, run_id: str):
+        await asyncio.to_thread(self._execute, "UPDATE runs SET attached_at = ? WHERE run_id = ?", (time.time(), run_id))
+
+    async def attached_since(self, run_id: str, since: float) -> bool:
+        rows = await asyncio.to_thread(self._execute, "SELECT attached_at FROM runs WHERE run_id = ?", (run_id,))
+        return bool(rows) and rows[0][0] > since
+
+    async def claim_orphans(self) -> List[Tuple[str, Dict[str, Any]]]:
+        now = time.time()
+
+        def claim():
+            claimed = []
+            # Orphans that were asked to stop are not restarted
+            self._execute(
+                "UPDATE runs SET status = 'cancelled', updated_at = ? WHERE status IN ('queued', 'running') "
+                "AND heartbeat < ? AND cancel_requested = 1",
+                (now, now - self.STALE_AFTER),
+            )
+            stale = self._execute(
+                "SELECT run_id, request, owner, heartbeat FROM runs WHERE status IN ('queued', 'running') AND heartbeat < ?",
+                (now - self.STALE_AFTER,),
+            )
+            for run_id, request, owner, heartbeat in stale:
+                # Compare-and-set so only one worker wins each run
+                with self._lock, self._conn:
+                    cursor = self._conn.execute(
+                        "UPDATE runs SET owner = ?, heartbeat = ? WHERE run_id = ? AND owner IS ? AND heartbeat = ?",
+                        (self.worker_id, now, run_id, owner, heartbeat),
+                    )
+                    won = cursor.rowcount == 1
+                if won:
+                    last = self._execute("SELECT MAX(id) FROM run_events WHERE run_id = ?", (run_id,))[0][0] or 0
+                    claimed.append((run_id, json.loads(request), last))
+            return claimed
+
+        claimed = await asyncio.to_thread(claim)
+        for run_id, _, last in claimed:
+            self._adopt(run_id, last)
+        return [(run_id, request) for run_id, request, _ in claimed]
+
+    async def release(self, run_ids: List[str]):
+        for run_id in run_ids:
+            await self._flush(run_id)
+        # A zero heartbeat is stale right away, so the next orphan sweep takes these over
+        await asyncio.to_thread(lambda: [
+            self._execute("UPDATE runs SET owner = NULL, heartbeat = 0 WHERE run_id = ? AND owner = ?", (run_id, self.worker_id))
+            for run_id in run_ids
+        ])
+        for run_id in run_ids:
+            self._local.pop(run_id, None)
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await self._flush()
+        with self._lock:
+            self._conn.close()
+
+
+def create_run_store() -> RunStore:
+    if RUN_STORE == "sqlite":
+        return SQLiteRunStore(RUN_STORE_PATH)
+    return InMemoryRunStore()
+
+
+class RunManager:
+    """
+    Submits workflow runs as background tasks and streams their stored events.
+    """
+
+    ORPHAN_CHECK_INTERVAL = 10.0
+    CANCEL_CHECK_INTERVAL = 1.0
+
+    def __init__(self, store: Optional[RunStore] = None, cancel_grace: float = RUN_CANCEL_GRACE):
+        self.store = store or create_run_store()
+        self.cancel_grace = cancel_grace
+        self.tasks: Dict[str, asyncio.Task] = {}
+        # Clients attached to each run on this worker
+        self.viewers: Dict[str, int] = {}
+        # Runs executed here that lost their last local client and are cancelled unless one re-attaches
+        self._watchdogs: Dict[str, asyncio.Task] = {}
+        # Why a run task was cancelled, for the log and metrics
+        self._cancel_reasons: Dict[str, str] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def submit(self, request: RunRequest) -> str:
+        run_id = uuid.uuid4().hex
+        await self.store.create(run_id, request.model_dump())
+        self._start(run_id, request)
+        return run_id
+
+    def _start(self, run_id: str, request: RunRequest, resumed: bool = False):
+        task = asyncio.create_task(self._execute(run_id, request, resumed))
+        self.tasks[run_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(run_id, None))
+
+    async def _execute(self, run_id: str, request: RunRequest, resumed: bool):
+        await self.store.set_status(run_id, "running")
+        status = "completed"
+        try:
+            if resumed:
+                await self.store.append(run_id, "log", {'agent': 'System', 'text': 'Worker restarted; re-running workflow.', 'type': 'info'})
+            async for event, payload in workflow_items(request):
+                await self.store.append(run_id, event, payload)
+        except asyncio.CancelledError:
+            reason = self._cancel_reasons.pop(run_id, "shutdown")
+            if reason == "handoff":
+                # Stopped for another worker to restart (see close()): no final status
+                status = None
+                await self.store.append(run_id, "log", {'agent': 'System', 'text': 'Worker shutting down; handing the run over to another worker.', 'type': 'info'})
+                raise
+            status = "cancelled"
+            RUNS_CANCELLED.inc(endpoint="run", reason=reason)
+            await self.store.append(run_id, "log", {'agent': 'System', 'text': f'Run cancelled ({reason}).', 'type': 'error'})
+            await self.store.append(run_id, "end", None)
+            raise
+        except GraphError as e:
+            # Empty workflow or cycle
+            status = "failed"
+            await self.store.append(run_id, "log", {'agent': 'System', 'text': str(e), 'type': 'error'})
+            await self.store.append(run_id, "end", None)
+        except Exception as e:
+            status = "failed"
+            await self.store.append(run_id, "log", {'agent': 'System', 'text': f'Error details: {str(e)}', 'type': 'error'})
+            await self.store.append(run_id, "end", None)
+        finally:
+            if status is not None:
+                await self.store.set_status(run_id, status)
+
+    async def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        return await self.store.get(run_id)
+
+    def _cancel_local(self, run_id: str, reason: str) -> bool:
+        task = self.tasks.get(run_id)
+        if task is None or task.done():
+            return False
+        self._cancel_reasons.setdefault(run_id, reason)
+        task.cancel()
+        return True
+
+    async def cancel(self, run_id: str) -> Optional[str]:
+        """
+        Cancels a run: running nodes stop their LLM streams and tools, pending nodes never start.
+        Returns the run's status afterwards ('cancelling' while it winds down), or None if unknown.
+        """
+        meta = await self.store.get(run_id)
+        if meta is None:
+            return None
+        if meta["status"] in TERMINAL_STATUSES:
+            return meta["status"]
+        if not self._cancel_local(run_id, "request"):
+            # Executed by another worker, which picks the request up on its next check
+            await self.store.request_cancel(run_id)
+        return "cancelling"
+
+    async def _cancel_when_unwatched(self, run_id: str):
+        try:
+            while run_id in self.tasks:
+                await asyncio.sleep(self.cancel_grace)
+                if self.viewers.get(run_id):
+                    return
+                # Clients that re-attached through another worker keep the run alive while they follow it
+                if not await self.store.attached_since(run_id, time.time() - self.cancel_grace):
+                    self._cancel_local(run_id, "disconnect")
+                    return
+        finally:
+            if self._watchdogs.get(run_id) is asyncio.current_task():
+                del self._watchdogs[run_id]
+
+    async def attach(self, run_id: str, last_event_id: int = 0, cancel_when_detached: bool = False) -> AsyncGenerator[Tuple[str, Optional[Dict[str, Any]], int], None]:
+        """
+        Yields (event, payload, id) for every logged event after `last_event_id`,
+        then follows the run live until it finishes.
+        With `cancel_when_detached`, the run is cancelled if this client goes away
+        and nobody else (on any worker) is attached after RUN_CANCEL_GRACE seconds.
+        """
+        self.viewers[run_id] = self.viewers.get(run_id, 0) + 1
+        watchdog = self._watchdogs.pop(run_id, None)
+        if watchdog is not None:
+            watchdog.cancel()
+        try:
+            async for item in self._follow(run_id, last_event_id):
+                yield item
+        finally:
+            self.viewers[run_id] -= 1
+            if not self.viewers[run_id]:
+                del self.viewers[run_id]
+                if cancel_when_detached and run_id in self.tasks:
+                    if self.cancel_grace > 0:
+                        self._watchdogs[run_id] = asyncio.create_task(self._cancel_when_unwatched(run_id))
+                    else:
+                        self._cancel_local(run_id, "disconnect")
+
+    async def _follow(self, run_id: str, last_event_id: int) -> AsyncGenerator[Tuple[str, Optional[Dict[str, Any]], int], None]:
+        after = last_event_id
+        touched = 0.0
+        while True:
+            if self.cancel_grace > 0 and run_id not in self.tasks and time.monotonic() - touched >= self.cancel_grace / 2:
+                # Let the executing worker know someone is still following
+                touched = time.monotonic()
+                await self.store.touch(run_id)
+            # Status before events: once a final status is seen, every event is already logged
+            meta = await self.store.get(run_id)
+            if meta is None:
+                return
+            entries = await self.store.events(run_id, after)
+            if entries and entries[0][0] > after + 1:
+                yield "log", {'agent': 'System', 'text': f'{entries[0][0] - after - 1} earlier events are no longer available.', 'type': 'info'}, entries[0][0] - 1
+            for event_id, event, payload in entries:
+                yield event, payload, event_id
+                after = event_id
+            if entries:
+                continue
+            if meta["status"] in TERMINAL_STATUSES:
+                return
+            await self.store.wait(run_id, after, timeout=15)
+
+    async def _sweep(self):
+        last_orphan_check = time.monotonic()
+        while True:
+            await asyncio.sleep(self.CANCEL_CHECK_INTERVAL)
+            try:
+                for run_id in await self.store.cancel_requests(list(self.tasks)):
+                    self._cancel_local(run_id, "request")
+                if time.monotonic() - last_orphan_check >= self.ORPHAN_CHECK_INTERVAL:
+                    last_orphan_check = time.monotonic()
+                    for run_id, request in await self.store.claim_orphans():
+                        self._start(run_id, RunRequest.model_validate(request), resumed=True)
+            except Exception:
+                pass
+
+    def start(self):
+        if isinstance(self.store, SQLiteRunStore):
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        for watchdog in list(self._watchdogs.values()):
+            watchdog.cancel()
+        # Stop running workflows before the store goes away. A shared store keeps them
+        # unfinished and hands them to another worker; otherwise they end as cancelled
+        run_ids = list(self.tasks)
+        tasks = list(self.tasks.values())
+        for run_id in run_ids:
+            self._cancel_local(run_id, "handoff" if self.store.shared else "shutdown")
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.store.shared:
+            await self.store.release(run_ids)
+        await self.store.close()
+
+
+run_manager = RunManager()
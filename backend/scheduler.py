@@ -0,0 +1,181 @@
+import os
+import time
+import asyncio
+from typing import AsyncGenerator, List, Dict, Any, Optional
+from .models import Workflow
+from .agents import Agent
+from .routing import agent_settings
+from .context import ContextWindow, message_tokens
+from .metrics import QUEUE_WAIT
+from .ratelimit import PRIORITY_BATCH
+
+# Default number of nodes allowed to run at the same time within one run
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("AGENTFORGE_MAX_CONCURRENCY", "4"))
+
+
+class GraphError(ValueError):
+    """
+    Raised when a workflow cannot be scheduled (empty graph or cycle).
+    """
+
+
+class WorkflowGraph:
+    """
+    Compiled view of a Workflow: node map, parent/child lists and a topological order.
+    Read-only once built, so one graph can serve many executions (see batch.py).
+    """
+
+    def __init__(self, workflow: Workflow):
+        if not workflow.nodes:
+            raise GraphError("Error: Empty workflow.")
+
+        self.nodes = {n.id: n for n in workflow.nodes}
+        self.children: Dict[str, List[str]] = {n.id: [] for n in workflow.nodes}
+        self.parents: Dict[str, List[str]] = {n.id: [] for n in workflow.nodes}
+        for edge in workflow.edges:
+            # Ignore dangling edges and duplicate connections
+            if edge.source not in self.nodes or edge.target not in self.nodes:
+                continue
+            if edge.target in self.children[edge.source]:
+                continue
+            self.children[edge.source].append(edge.target)
+            self.parents[edge.target].append(edge.source)
+
+        self.order = self._topological_order()
+        self.position = {node_id: i for i, node_id in enumerate(self.order)}
+
+        # Every ancestor of a node, in topological order, so a node sees the
+        # same upstream context a linear chain would have given it
+        self.ancestors: Dict[str, List[str]] = {}
+        for node_id in self.order:
+            seen = set()
+            for parent_id in self.parents[node_id]:
+                seen.update(self.ancestors[parent_id])
+                seen.add(parent_id)
+            self.ancestors[node_id] = sorted(seen, key=self.position.get)
+
+        # Agent model settings per node, resolved once so a graph can be reused across runs
+        self.agent_kwargs = {node_id: agent_settings(node.data) for node_id, node in self.nodes.items()}
+
+    def _topological_order(self) -> List[str]:
+        # Kahn's algorithm, seeded in definition order to keep runs reproducible
+        in_degree = {node_id: len(parents) for node_id, parents in self.parents.items()}
+        ready = [node_id for node_id in self.nodes if in_degree[node_id] == 0]
+        order = []
+        while ready:
+            node_id = ready.pop(0)
+            order.append(node_id)
+            for child_id in self.children[node_id]:
+                in_degree[child_id] -= 1
+                if in_degree[child_id] == 0:
+                    ready.append(child_id)
+
+        if len(order) != len(self.nodes):
+            raise GraphError("Loop detected. Stopping execution.")
+        return order
+
+    @property
+    def start_nodes(self) -> List[str]:
+        return [node_id for node_id in self.order if not self.parents[node_id]]
+
+
+async def execute_graph(
+    graph: WorkflowGraph,
+    prompt: str,
+    max_concurrency: Optional[int] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_BATCH,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Runs every node of the graph as soon as all of its parents have finished.
+    Independent branches run concurrently (bounded by max_concurrency) and their
+    events are interleaved, each tagged with the node id that produced it.
+    `priority` is the rate limiter queue priority of the nodes' LLM calls.
+    """
+    limit = max(1, max_concurrency or DEFAULT_MAX_CONCURRENCY)
+    semaphore = asyncio.Semaphore(limit)
+    events: asyncio.Queue = asyncio.Queue()
+
+    # node id -> (history message, token count), counted once and reused downstream
+    outputs: Dict[str, tuple] = {}
+    prompt_message = {"role": "user", "content": prompt}
+    prompt_tokens = message_tokens(prompt_message)
+    waiting_on = {node_id: len(parents) for node_id, parents in graph.parents.items()}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run_node(node_id: str):
+        queued = time.perf_counter()
+        try:
+            async with semaphore:
+                queue_wait = time.perf_counter() - queued
+                QUEUE_WAIT.observe(queue_wait, stage="node")
+                node = graph.nodes[node_id]
+                node_type = node.data.get("name", "Unknown")  # 'Researcher', 'Writer' etc.
+                system_prompt = node.data.get("system_prompt", "")
+
+                await events.put({"agent": "System", "text": f"Activating {node_type}...", "type": "info", "node_id": node_id})
+
+                # Tools are assigned in Agent.__init__ based on name (Researcher/Coder get tools);
+                # model/temperature/max_tokens come from node.data and the routing defaults
+                agent = Agent(name=node_type, system_prompt=system_prompt, use_cache=use_cache, priority=priority, **graph.agent_kwargs[node_id])
+                agent.stats.queue_wait = queue_wait
+
+                # Context: original prompt followed by the output of every upstream node,
+                # trimmed to the agent's token budget
+                history = ContextWindow()
+                history.append(prompt_message, prompt_tokens)
+                for ancestor_id in graph.ancestors[node_id]:
+                    if ancestor_id in outputs:
+                        history.append(*outputs[ancestor_id])
+                pruned_history = history.build(agent.context_budget())
+
+                full_response = ""
+                stream = agent.run_stream(pruned_history)
+                try:
+                    async for event in stream:
+                        if event["type"] == "thought":
+                            full_response += event["text"]
+                        await events.put({**event, "node_id": node_id})
+                finally:
+                    await stream.aclose()
+
+                if full_response:
+                    message = {"role": "assistant", "content": f"[{node_type}]: {full_response}"}
+                    outputs[node_id] = (message, message_tokens(message))
+                agent.stats.finish("run")
+                await events.put({"agent": node_type, "type": "metrics", "node_id": node_id, "metrics": agent.stats.as_dict()})
+                await events.put({"agent": "System", "text": f"{node_type} finished.", "type": "info", "node_id": node_id})
+        except Exception as e:
+            await events.put({"agent": "System", "text": f"Error details: {str(e)}", "type": "error", "node_id": node_id})
+        finally:
+            # Completion marker, always queued after the node's own events
+            await events.put({"type": "_done", "node_id": node_id})
+
+    def start(node_id: str):
+        tasks[node_id] = asyncio.create_task(run_node(node_id))
+
+    for node_id in graph.start_nodes:
+        start(node_id)
+    running = len(tasks)
+
+    try:
+        while running:
+            event = await events.get()
+            if event["type"] != "_done":
+                yield event
+                continue
+
+            running -= 1
+            for child_id in graph.children[event["node_id"]]:
+                waiting_on[child_id] -= 1
+                if waiting_on[child_id] == 0:
+                    start(child_id)
+                    running += 1
+    finally:
+        # Consumer went away early (disconnect, cancelled run): stop running nodes, which
+        # closes their LLM streams and tool calls; nodes that haven't started never will
+        leftover = [task for task in tasks.values() if not task.done()]
+        for task in leftover:
+            task.cancel()
+        if leftover:
+            await asyncio.gather(*leftover, return_exceptions=True)
@@ -0,0 +1,68 @@
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from .context import ContextWindow
+
+SESSION_TTL = float(os.environ.get("AGENTFORGE_SESSION_TTL", "1800"))
+MAX_SESSIONS = int(os.environ.get("AGENTFORGE_MAX_SESSIONS", "1000"))
+
+
+class RunSession:
+    """
+    Server-side history of one frontend run, so /run_node calls only send the session id.
+    """
+
+    def __init__(self, prompt: str, history: Optional[List[Dict[str, Any]]] = None):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.history = ContextWindow(history or [{"role": "user", "content": prompt}])
+        self.created_at = self.last_used = time.monotonic()
+
+    def append_output(self, agent_name: str, content: str):
+        self.history.append({"role": "assistant", "content": f"[{agent_name}]: {content}"})
+
+
+class SessionStore:
+    """
+    In-memory sessions, evicted when idle for longer than `ttl` or, past
+    `max_sessions`, least recently used first. Only touched from the event loop.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, RunSession]" = OrderedDict()
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl
+        # Least recently used first, so stop at the first live session
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.last_used > cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    def create(self, prompt: str, history: Optional[List[Dict[str, Any]]] = None) -> RunSession:
+        session = RunSession(prompt, history)
+        self._sessions[session.id] = session
+        self._evict()
+        return session
+
+    def get(self, session_id: str) -> Optional[RunSession]:
+        self._evict()
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+sessions = SessionStore()
@@ -0,0 +1,133 @@
+import os
+import json
+import asyncio
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+# Faster serializer when available (optional: `pip install orjson`). Its output is
+# UTF-8 rather than ASCII escapes; the frontend decodes streamed reads incrementally
+try:
+    import orjson
+
+    def _dumps(data: Any) -> bytes:
+        return orjson.dumps(data)
+except ImportError:
+    def _dumps(data: Any) -> bytes:
+        return json.dumps(data).encode("ascii")
+
+# Coalescing window for `thought` chunks: flush after this many ms or bytes
+FLUSH_MS = float(os.environ.get("AGENTFORGE_SSE_FLUSH_MS", "25"))
+MAX_BATCH_BYTES = int(os.environ.get("AGENTFORGE_SSE_MAX_BYTES", "4096"))
+
+# Pre-encoded frame parts
+_ID = b"id: "
+_EVENT = b"event: "
+_DATA = b"\ndata: "
+_END = b"\n\n"
+_PREFIXES: Dict[str, bytes] = {}
+
+# (event name, payload) or (event name, payload, event id); payload None means an empty data line
+SSEItem = Tuple[Any, ...]
+
+
+def encode_event(event: str, data: Optional[Dict[str, Any]] = None, event_id: Optional[int] = None) -> bytes:
+    prefix = _PREFIXES.get(event)
+    if prefix is None:
+        prefix = _PREFIXES[event] = _EVENT + event.encode("ascii") + _DATA
+    if event_id is not None:
+        # Lets clients resume with Last-Event-ID
+        prefix = _ID + str(event_id).encode("ascii") + b"\n" + prefix
+    if data is None:
+        return prefix + _END
+    return prefix + _dumps(data) + _END
+
+
+def _thought_key(item: SSEItem):
+    event, data = item[0], item[1]
+    if event == "log" and data and data.get("type") == "thought":
+        return data.get("agent"), data.get("node_id")
+    return None
+
+
+async def sse_stream(
+    items: AsyncIterator[SSEItem],
+    flush_ms: float = FLUSH_MS,
+    max_bytes: int = MAX_BATCH_BYTES,
+) -> AsyncIterator[bytes]:
+    """
+    Encodes (event, payload) items as SSE frames.
+    Consecutive `thought` logs from the same agent/node are merged into one frame
+    until `flush_ms` has passed since the first of them or `max_bytes` of text is
+    buffered; any other event flushes the buffer first and is sent right away.
+    A merged frame carries the id of the last chunk it contains.
+    """
+    iterator = items.__aiter__()
+    if flush_ms <= 0:
+        try:
+            async for item in iterator:
+                yield encode_event(*item)
+        finally:
+            if hasattr(iterator, "aclose"):
+                await iterator.aclose()
+        return
+
+    loop = asyncio.get_running_loop()
+    window = flush_ms / 1000
+    pending: Optional[asyncio.Future] = None
+    # Buffered thought: key, first payload, text parts, byte count, last id, flush deadline
+    key = payload = last_id = None
+    parts = []
+    size = 0
+    deadline = 0.0
+
+    def flush() -> bytes:
+        nonlocal key, payload, last_id, parts, size
+        frame = encode_event("log", {**payload, "text": "".join(parts)}, last_id)
+        key = payload = last_id = None
+        parts, size = [], 0
+        return frame
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            if key is not None:
+                # Wait for the next item only until the buffered text is due
+                done, _ = await asyncio.wait({pending}, timeout=max(deadline - loop.time(), 0))
+                if not done:
+                    yield flush()
+                    continue
+            try:
+                item = await pending
+            except StopAsyncIteration:
+                pending = None
+                break
+            pending = None
+
+            item_key = _thought_key(item)
+            if key is not None and item_key != key:
+                yield flush()
+            if item_key is None:
+                yield encode_event(*item)
+                continue
+
+            if key is None:
+                key, payload, deadline = item_key, item[1], loop.time() + window
+            text = item[1].get("text", "")
+            last_id = item[2] if len(item) > 2 else None
+            parts.append(text)
+            size += len(text)
+            if size >= max_bytes:
+                yield flush()
+
+        if key is not None:
+            yield flush()
+    finally:
+        # Consumer went away (e.g. client disconnect): stop the producer too
+        if pending is not None and not pending.done():
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, StopAsyncIteration, Exception):
+                pass
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
@@ -1,47 +1,105 @@
+import os
 import json
-from typing import List, Dict, Any
+import time
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Dict, Any, Optional
 from duckduckgo_search import DDGS
-import chromadb
-from chromadb.utils import embedding_functions
+from .cache import ResultCache
+from .metrics import TOOL_CALLS, TOOL_DURATION
+from .embeddings import embedding_service
 
-# Initialize Vector DB (Ephemeral for demo)
-chroma_client = chromadb.Client()
-collection = chroma_client.get_or_create_collection(name="knowledge_base")
+# Vector DB
+# Created lazily on first RAG use so workers and workflows that never touch
+# local_rag don't pay for importing chromadb. Set AGENTFORGE_CHROMA_PATH to
+# persist the knowledge base on disk; otherwise it is ephemeral (in-memory).
+# Embeddings use Chroma's default model (ONNX MiniLM), computed by the embedding
+# service (backend/embeddings.py) rather than by Chroma in the calling thread.
+CHROMA_PATH = os.environ.get("AGENTFORGE_CHROMA_PATH") or None
+COLLECTION_NAME = os.environ.get("AGENTFORGE_CHROMA_COLLECTION", "knowledge_base")
 
-# Simple embedding function usage (using default if sentence-transformers not explicitly loaded here to save startup time, 
-# or letting chroma handle it. Chroma default is ONNX MiniLM, which is fine)
+_collection = None
+_collection_lock = threading.Lock()
 
-def web_search(query: str) -> str:
+def get_collection():
     """
-    Performs a web search using DuckDuckGo.
+    Returns the knowledge base collection, creating the Chroma client on first call.
+    """
+    global _collection
+    if _collection is None:
+        with _collection_lock:
+            if _collection is None:
+                import chromadb
+                if CHROMA_PATH:
+                    chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+                else:
+                    chroma_client = chromadb.Client()
+                _collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
+    return _collection
+
+def warm_up_vector_store():
+    """
+    Creates the collection and loads the embedding model ahead of the first request.
+    For deployments that would rather pay the cost at boot (AGENTFORGE_WARM_RAG=1).
     """
+    get_collection()
+    # Start the embedding workers and load the ONNX model in each
+    embedding_service.warm_up()
+
+# Search result cache: in-memory LRU, optionally backed by SQLite so it survives restarts
+search_cache = ResultCache(
+    "web_search",
+    max_entries=int(os.environ.get("AGENTFORGE_SEARCH_CACHE_SIZE", "256")),
+    ttl=float(os.environ.get("AGENTFORGE_SEARCH_CACHE_TTL", "3600")),
+    path=os.environ.get("AGENTFORGE_SEARCH_CACHE_PATH") or None,
+)
+
+def _normalize_query(query: str) -> str:
+    # Case, surrounding punctuation and whitespace runs don't change the results
+    return " ".join(query.lower().split()).strip(" ?!.")
+
+def _search(query: str, max_results: int) -> str:
     try:
-        results = DDGS().text(query, max_results=3)
+        results = DDGS().text(query, max_results=max_results)
         if not results:
             return "No results found."
         return json.dumps(results)
     except Exception as e:
         return f"Search error: {str(e)}"
 
+def web_search(query: str, max_results: int = 3) -> str:
+    """
+    Performs a web search using DuckDuckGo.
+    Results are cached by normalized query; concurrent identical lookups share one request.
+    """
+    key = f"{max_results}:{_normalize_query(query)}"
+    return search_cache.get_or_compute(
+        key,
+        lambda: _search(query, max_results),
+        cacheable=lambda result: not result.startswith("Search error"),
+    )
+
 def local_rag(query: str, content: str = None) -> str:
     """
     If 'content' is provided, adds it to the knowledge base.
     If only 'query' is provided, searches the knowledge base.
     """
     try:
+        collection = get_collection()
         if content:
-            # Add to KB
-            doc_id = str(hash(content))
-            collection.add(
-                documents=[content],
-                metadatas=[{"source": "user_input"}],
-                ids=[doc_id]
-            )
+            # Add to KB: chunked and keyed by a stable content hash (see backend/ingest.py)
+            from .ingest import ingest_documents
+            stats = ingest_documents([{"content": content, "metadata": {"source": "user_input"}}])
+            if not stats["added"]:
+                return "Content already in knowledge base."
             return "Content added to knowledge base."
         else:
-            # Query KB
+            # Query KB (embedded by the shared, micro-batched embedding service)
             results = collection.query(
-                query_texts=[query],
+                query_embeddings=[embedding_service.embed_query(query)],
                 n_results=2
             )
             return json.dumps(results['documents'])
@@ -94,3 +152,70 @@ AVAILABLE_TOOLS = {
     "web_search": web_search,
     "local_rag": local_rag
 }
+
+# Async tool layer
+# Sync tools run on a bounded thread pool so they never block the event loop;
+# native async tools (coroutine functions) are awaited directly.
+TOOL_WORKERS = int(os.environ.get("AGENTFORGE_TOOL_WORKERS", "8"))
+DEFAULT_TOOL_TIMEOUT = float(os.environ.get("AGENTFORGE_TOOL_TIMEOUT", "30"))
+
+# Per-tool overrides of DEFAULT_TOOL_TIMEOUT (seconds)
+TOOL_TIMEOUTS: Dict[str, float] = {
+    "web_search": 15.0,
+}
+
+# Tools report failures as strings so the LLM can react; these mark an error result
+TOOL_ERROR_PREFIXES = ("Error", "Search error", "RAG error")
+
+_tool_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_tool_executor() -> ThreadPoolExecutor:
+    global _tool_executor
+    if _tool_executor is None:
+        _tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="agentforge-tool")
+    return _tool_executor
+
+
+async def run_tool(name: str, args: Dict[str, Any]) -> str:
+    """
+    Executes a tool by name without blocking the event loop.
+    Errors and timeouts are returned as strings so they can go back to the LLM.
+    """
+    tool_fn = AVAILABLE_TOOLS.get(name)
+    if not tool_fn:
+        TOOL_CALLS.inc(tool=name, status="not_found")
+        return f"Error: Tool {name} not found."
+
+    timeout = TOOL_TIMEOUTS.get(name, DEFAULT_TOOL_TIMEOUT)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        if inspect.iscoroutinefunction(tool_fn):
+            call = tool_fn(**args)
+        else:
+            loop = asyncio.get_running_loop()
+            call = loop.run_in_executor(_get_tool_executor(), partial(tool_fn, **args))
+        result = str(await asyncio.wait_for(call, timeout=timeout))
+        if result.startswith(TOOL_ERROR_PREFIXES):
+            status = "error"
+    except asyncio.TimeoutError:
+        status = "timeout"
+        result = f"Error: Tool {name} timed out after {timeout:g}s."
+    except Exception as e:
+        status = "error"
+        result = f"Error executing tool: {str(e)}"
+    finally:
+        TOOL_DURATION.observe(time.perf_counter() - started, tool=name)
+    TOOL_CALLS.inc(tool=name, status=status)
+    return result
+
+
+def shutdown_tool_executor():
+    """
+    Stops the tool thread pool. Called from the FastAPI lifespan on shutdown.
+    """
+    global _tool_executor
+    if _tool_executor is not None:
+        _tool_executor.shutdown(wait=False, cancel_futures=True)
+        _tool_executor = None
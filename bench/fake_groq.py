@@ -0,0 +1,91 @@
+"""
+Local stand-in for the Groq chat completions API.
+
+Streams OpenAI-compatible `chat.completion.chunk` events at a configurable rate
+and, for agents that have tools, issues tool calls on their first turn. Point the
+backend at it with GROQ_BASE_URL=http://127.0.0.1:<port>.
+"""
+import json
+import time
+import uuid
+import asyncio
+from dataclasses import dataclass, field
+from typing import Tuple
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+@dataclass
+class FakeGroqConfig:
+    tokens: int = 200              # content tokens per completion
+    tokens_per_second: float = 500  # streaming rate (0 = as fast as possible)
+    ttft_ms: float = 150           # delay before the first chunk
+    tool_calls: int = 1            # tool calls issued on the first turn of tool-enabled agents
+    token_text: str = "lorem "
+    # Smaller models answer faster: TTFT divided and streaming rate multiplied by `fast_speedup`
+    fast_models: Tuple[str, ...] = field(default=("llama-3.1-8b-instant",))
+    fast_speedup: float = 3.0
+
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def create_app(config: FakeGroqConfig) -> FastAPI:
+    app = FastAPI(title="Fake Groq")
+    app.state.requests = 0
+    app.state.models = {}
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        model = body.get("model", "fake")
+        app.state.models[model] = app.state.models.get(model, 0) + 1
+        speedup = config.fast_speedup if model in config.fast_models else 1.0
+        messages = body.get("messages", [])
+        # Tool-enabled agents call tools once, then answer after seeing the results
+        wants_tools = bool(body.get("tools")) and config.tool_calls > 0 and not any(m.get("role") == "tool" for m in messages)
+
+        async def stream():
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            await asyncio.sleep(config.ttft_ms / 1000 / speedup)
+            yield _chunk(completion_id, model, {"role": "assistant", "content": ""})
+
+            delay = 1 / (config.tokens_per_second * speedup) if config.tokens_per_second > 0 else 0
+            if wants_tools:
+                for i in range(config.tool_calls):
+                    name = "web_search" if i % 2 == 0 else "local_rag"
+                    arguments = json.dumps({"query": f"benchmark query {i}"})
+                    half = len(arguments) // 2
+                    # Arguments arrive in fragments (~4 chars per token), like the real API
+                    if delay:
+                        await asyncio.sleep(delay * half / 4)
+                    yield _chunk(completion_id, model, {"tool_calls": [{
+                        "index": i, "id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+                        "function": {"name": name, "arguments": arguments[:half]},
+                    }]})
+                    if delay:
+                        await asyncio.sleep(delay * (len(arguments) - half) / 4)
+                    yield _chunk(completion_id, model, {"tool_calls": [{
+                        "index": i, "function": {"arguments": arguments[half:]},
+                    }]})
+                yield _chunk(completion_id, model, {}, "tool_calls")
+            else:
+                for _ in range(config.tokens):
+                    if delay:
+                        await asyncio.sleep(delay)
+                    yield _chunk(completion_id, model, {"content": config.token_text})
+                yield _chunk(completion_id, model, {}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
@@ -0,0 +1,247 @@
+"""
+Offline benchmark for /run and /run_node.
+
+Starts the local fake Groq server (bench/fake_groq.py) and the AgentForge backend
+in-process, stubs web_search/local_rag with fixed-latency fakes, then drives many
+concurrent workflows over HTTP and reports JSON results:
+
+    python -m bench.run --workflows 100 --concurrency 25 --mode run --output bench.json
+    python -m bench.run --mode run_node --baseline bench.json   # exit 1 on regression
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import threading
+import statistics
+from typing import Any, Dict, List
+
+import httpx
+import uvicorn
+
+from .fake_groq import FakeGroqConfig, create_app
+
+# Researcher -> (Writer, Coder) -> Critic
+WORKFLOW = {
+    "nodes": [
+        {"id": "researcher", "type": "agent", "data": {"name": "Researcher"}},
+        {"id": "writer", "type": "agent", "data": {"name": "Writer"}},
+        {"id": "coder", "type": "agent", "data": {"name": "Coder"}},
+        {"id": "critic", "type": "agent", "data": {"name": "Critic"}},
+    ],
+    "edges": [
+        {"id": "e1", "source": "researcher", "target": "writer"},
+        {"id": "e2", "source": "researcher", "target": "coder"},
+        {"id": "e3", "source": "writer", "target": "critic"},
+        {"id": "e4", "source": "coder", "target": "critic"},
+    ],
+}
+# Order the frontend would execute the same graph node by node
+NODE_ORDER = ["Researcher", "Writer", "Coder", "Critic"]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(app, port: int) -> uvicorn.Server:
+    """
+    Runs an ASGI app with uvicorn on its own thread (and event loop).
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def _stub_tools(latency_ms: float):
+    from backend import tools
+
+    def web_search(query: str, max_results: int = 3) -> str:
+        time.sleep(latency_ms / 1000)
+        return json.dumps([{"title": f"Result for {query}", "href": "https://example.com", "body": "..."}])
+
+    def local_rag(query: str, content: str = None) -> str:
+        time.sleep(latency_ms / 1000)
+        return json.dumps([["Stub knowledge base document."]])
+
+    tools.AVAILABLE_TOOLS["web_search"] = web_search
+    tools.AVAILABLE_TOOLS["local_rag"] = local_rag
+
+
+async def _consume(response: httpx.Response, started: float, sample: Dict[str, Any]):
+    async for data in response.aiter_bytes():
+        if sample["ttfb"] is None:
+            sample["ttfb"] = time.perf_counter() - started
+        sample["events"] += data.count(b"event: ")
+        sample["bytes"] += len(data)
+
+
+async def drive_run(client: httpx.AsyncClient, base_url: str, i: int) -> Dict[str, Any]:
+    sample = {"ttfb": None, "events": 0, "bytes": 0, "ok": False}
+    started = time.perf_counter()
+    async with client.stream("POST", f"{base_url}/run", json={"workflow": WORKFLOW, "prompt": f"Benchmark prompt {i}"}) as response:
+        await _consume(response, started, sample)
+        sample["ok"] = response.status_code == 200
+    sample["latency"] = time.perf_counter() - started
+    return sample
+
+
+async def drive_run_node(client: httpx.AsyncClient, base_url: str, i: int) -> Dict[str, Any]:
+    # Mirrors the frontend: one session, then each node in turn
+    sample = {"ttfb": None, "events": 0, "bytes": 0, "ok": True}
+    started = time.perf_counter()
+    session = (await client.post(f"{base_url}/sessions", json={"prompt": f"Benchmark prompt {i}"})).json()
+    for name in NODE_ORDER:
+        payload = {"agent_config": {"name": name}, "session_id": session["session_id"]}
+        async with client.stream("POST", f"{base_url}/run_node", json=payload) as response:
+            await _consume(response, started, sample)
+            sample["ok"] = sample["ok"] and response.status_code == 200
+    sample["latency"] = time.perf_counter() - started
+    return sample
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000, 2)
+
+    return {
+        "p50": pct(50), "p90": pct(90), "p95": pct(95), "p99": pct(99),
+        "max": round(ordered[-1] * 1000, 2), "mean": round(statistics.fmean(ordered) * 1000, 2),
+    }
+
+
+async def run_benchmark(args, base_url: str) -> Dict[str, Any]:
+    drive = drive_run if args.mode == "run" else drive_run_node
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        async def one(i: int) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await drive(client, base_url, i)
+                except Exception as e:
+                    return {"ok": False, "error": str(e), "ttfb": None, "latency": None, "events": 0, "bytes": 0}
+
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(one(i) for i in range(args.workflows)))
+        wall = time.perf_counter() - started
+
+    ok = [s for s in samples if s["ok"]]
+    events = sum(s["events"] for s in samples)
+    return {
+        "workflows": args.workflows,
+        "succeeded": len(ok),
+        "errors": len(samples) - len(ok),
+        "wall_seconds": round(wall, 3),
+        "workflows_per_sec": round(len(ok) / wall, 3) if wall else 0.0,
+        "ttfb_ms": _percentiles([s["ttfb"] for s in ok if s["ttfb"] is not None]),
+        "latency_ms": _percentiles([s["latency"] for s in ok]),
+        "events": events,
+        "events_per_sec": round(events / wall, 1) if wall else 0.0,
+        "bytes": sum(s["bytes"] for s in samples),
+    }
+
+
+def _regressions(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    found = []
+    current, previous = result["results"], baseline["results"]
+    for metric in ("ttfb_ms", "latency_ms"):
+        for stat in ("p50", "p95"):
+            old, new = previous.get(metric, {}).get(stat), current.get(metric, {}).get(stat)
+            if old and new and new > old * (1 + tolerance):
+                found.append(f"{metric}.{stat}: {old} -> {new}")
+    for metric in ("events_per_sec", "workflows_per_sec"):
+        old, new = previous.get(metric), current.get(metric)
+        if old and new is not None and new < old * (1 - tolerance):
+            found.append(f"{metric}: {old} -> {new}")
+    if current["errors"] > previous["errors"]:
+        found.append(f"errors: {previous['errors']} -> {current['errors']}")
+    return found
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline AgentForge benchmark against a fake Groq server.")
+    parser.add_argument("--mode", choices=["run", "run_node"], default="run")
+    parser.add_argument("--workflows", type=int, default=50, help="total workflows to execute")
+    parser.add_argument("--concurrency", type=int, default=10, help="workflows in flight at once")
+    parser.add_argument("--tokens", type=int, default=200, help="content tokens per completion")
+    parser.add_argument("--tokens-per-second", type=float, default=500)
+    parser.add_argument("--ttft-ms", type=float, default=150)
+    parser.add_argument("--tool-calls", type=int, default=1, help="tool calls per tool-enabled agent")
+    parser.add_argument("--tool-latency-ms", type=float, default=100)
+    parser.add_argument("--fast-speedup", type=float, default=3.0, help="how much faster the fake serves fast models")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="write JSON results to this file (default: stdout)")
+    parser.add_argument("--baseline", help="previous results JSON; exit 1 if a metric regressed")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    fake_config = FakeGroqConfig(
+        tokens=args.tokens,
+        tokens_per_second=args.tokens_per_second,
+        ttft_ms=args.ttft_ms,
+        tool_calls=args.tool_calls,
+        fast_speedup=args.fast_speedup,
+    )
+    fake_app = create_app(fake_config)
+    fake_port = _free_port()
+    fake_server = _serve(fake_app, fake_port)
+
+    # Must be set before the backend builds its Groq client
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{fake_port}"
+    os.environ.setdefault("GROQ_API_KEY", "bench")
+    from backend.main import app
+
+    _stub_tools(args.tool_latency_ms)
+    backend_port = _free_port()
+    backend_server = _serve(app, backend_port)
+
+    try:
+        results = asyncio.run(run_benchmark(args, f"http://127.0.0.1:{backend_port}"))
+    finally:
+        backend_server.should_exit = True
+        fake_server.should_exit = True
+
+    # ru_maxrss is KiB on Linux (bytes on macOS); covers the servers and the driver
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["peak_rss_mb"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    results["fake_groq_requests"] = fake_app.state.requests
+    results["fake_groq_models"] = fake_app.state.models
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = _regressions(report, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions vs baseline:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())